@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# this project is licensed under the WTFPLv2, see COPYING.wtfpl for details
+
+# compare excerpt building by parsing the whole mail vs streaming it
+# run with: python benchmarks/bench_excerpt.py
+
+from email.message import EmailMessage
+import email.policy
+from io import BytesIO
+import os
+import re
+from timeit import timeit
+
+from lierre.mailutils.excerpt import get_excerpt, html_to_text
+
+
+def build_mail(attachment_size, attachments=2):
+    msg = EmailMessage()
+    msg['Subject'] = 'benchmark'
+    msg.set_content('> some quote\n' * 20 + 'Hello, here are the files.\n' * 5)
+    msg.add_alternative('<p>Hello, here are the files.</p>', subtype='html')
+    for n in range(attachments):
+        msg.add_attachment(
+            os.urandom(attachment_size), maintype='application', subtype='pdf',
+            filename='file%d.pdf' % n,
+        )
+    return msg.as_bytes(policy=email.policy.default)
+
+
+def full_parse_excerpt(fp):
+    # what was done before streaming
+    pymessage = email.message_from_binary_file(fp, policy=email.policy.default)
+
+    body = pymessage.get_body(('plain',))
+    if body is not None:
+        text = re.sub(r'^>.*$', '', body.get_content(), flags=re.MULTILINE)
+    else:
+        body = pymessage.get_body(('html',))
+        text = html_to_text(body.get_content()) if body is not None else ''
+    return re.sub(r'\s+', ' ', text)[:100]
+
+
+def main():
+    print('%12s %12s %12s' % ('attachments', 'full (ms)', 'stream (ms)'))
+    for size in (10 << 10, 1 << 20, 10 << 20):
+        data = build_mail(size)
+        assert full_parse_excerpt(BytesIO(data)) == get_excerpt(BytesIO(data))
+
+        number = max(1, (1 << 22) // len(data))
+        full = timeit(lambda: full_parse_excerpt(BytesIO(data)), number=number) / number
+        stream = timeit(lambda: get_excerpt(BytesIO(data)), number=number) / number
+        print('%10d K %12.2f %12.2f' % (2 * size >> 10, full * 1000, stream * 1000))
+
+
+if __name__ == '__main__':
+    main()
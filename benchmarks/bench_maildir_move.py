@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# this project is licensed under the WTFPLv2, see COPYING.wtfpl for details
+
+# compare moving messages with attachments to another folder by copying them
+# (as done before) and by renaming them
+# run with: python benchmarks/bench_maildir_move.py [directory on the filesystem to test]
+
+from email.message import EmailMessage
+from pathlib import Path
+import shutil
+import sys
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from lierre.utils.maildir_ops import MaildirPP
+
+
+MESSAGES = 10000
+
+ATTACHMENT_SIZE = 64 * 1024
+
+
+class CopyingMaildirPP(MaildirPP):
+    # what was done before renaming
+    def move_message(self, msg_path, folder):
+        msg_path = Path(msg_path)
+        old_flags = self._parse_flags(msg_path.name)
+
+        tmp_uniq = self._build_uniq(folder)
+        shutil.copy(str(msg_path), str(tmp_uniq))
+
+        ret = self._move_to_cur(tmp_uniq, folder, flags=old_flags)
+        msg_path.unlink()
+        return ret
+
+
+def build_message(n):
+    msg = EmailMessage()
+    msg['Subject'] = 'message %d' % n
+    msg.set_content('see attachment')
+    msg.add_attachment(
+        bytes(i % 256 for i in range(ATTACHMENT_SIZE)),
+        maintype='application', subtype='octet-stream', filename='data.bin',
+    )
+    return msg
+
+
+def measure(box_class, root):
+    box = box_class(root)
+    box.create_folder(box.get_root())
+    folder = box.try_get_folder(['Trash'])
+    box.create_folder(folder)
+
+    # all messages have the same content, write it once
+    data = bytes(build_message(0))
+    paths = []
+    for n in range(MESSAGES):
+        path = box.path.joinpath('cur', '%d.M0P0.bench:2,S' % n)
+        path.write_bytes(data)
+        paths.append(path)
+
+    start = perf_counter()
+    for path in paths:
+        box.move_message(path, folder)
+    return perf_counter() - start
+
+
+def main():
+    base = sys.argv[1] if len(sys.argv) > 1 else None
+
+    print('%d messages of %d KiB' % (MESSAGES, ATTACHMENT_SIZE * 4 // 3 // 1024))
+    for name, box_class in (
+        ('copy', CopyingMaildirPP),
+        ('rename', MaildirPP),
+    ):
+        with TemporaryDirectory(dir=base) as root:
+            elapsed = measure(box_class, root)
+        print('  %-8s %8.1f ms' % (name, elapsed * 1000))
+
+
+if __name__ == '__main__':
+    main()
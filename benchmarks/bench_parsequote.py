@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# this project is licensed under the WTFPLv2, see COPYING.wtfpl for details
+
+# compare quoting a digest mail with the tree parser used before and with
+# streaming events, in time and peak memory
+# run with: python benchmarks/bench_parsequote.py
+
+import random
+import sys
+from time import perf_counter
+import tracemalloc
+
+from lierre.mailutils.parsequote import Line, Block, QUOTING, parse_events, to_text
+
+
+DIGEST_LINES = 50000
+
+DEEP_LEVELS = 3000
+
+
+class TreeParser:
+    # what was done before streaming events
+    def __init__(self):
+        self.level = 0
+        self.ret = []
+        self.buf = []
+        self.lines = []
+
+    def _build_lines(self, text):
+        for line in text.splitlines():
+            q = Line()
+            q.original_text = line
+
+            mtc = QUOTING.match(line)
+            if mtc:
+                q.text = line[mtc.end():]
+                q.level = mtc.group().count('>')
+            else:
+                q.text = q.original_text
+
+            self.lines.append(q)
+
+    def parse(self, text):
+        self._build_lines(text)
+
+        for q in self.lines:
+            if q.level == self.level:
+                self.buf.append(q)
+            else:
+                self._dump_buf()
+                self.level = q.level
+                self.buf.append(q)
+
+        if self.buf:
+            self._dump_buf()
+
+        return self.ret
+
+    def _dump_buf(self):
+        if not self.buf:
+            return
+
+        b = Block()
+        b.level = self.buf[-1].level
+        b.content = self.buf
+        self.buf = []
+
+        if not self.level or not self.ret or not self.ret[-1].level:
+            self.ret.append(b)
+            return
+
+        self._dump_buf_recurse(b, self.ret)
+
+    def _dump_buf_recurse(self, b, current):
+        last = current[-1]
+
+        if last.level == b.level:
+            last.content.extend(b.content)
+            return
+        if last.level > b.level:
+            current[-1] = b
+            b.content.insert(0, last)
+            return
+
+        if isinstance(last, Block):
+            self._dump_buf_recurse(b, last.content)
+        else:
+            current.append(b)
+
+
+def tree_to_text(ls):
+    parts = []
+
+    def recurse(block):
+        if isinstance(block, Line):
+            if block.level:
+                parts.append(('>' * block.level) + ' ' + block.text)
+            else:
+                parts.append(block.text)
+        else:
+            for sub in block.content:
+                recurse(sub)
+
+    for block in ls:
+        recurse(block)
+
+    return '\n'.join(parts)
+
+
+def build_digest():
+    rnd = random.Random(0)
+    lines = []
+    while len(lines) < DIGEST_LINES:
+        # a digest is many mails quoting previous mails of the discussion
+        depth = rnd.randint(0, 6)
+        for level in range(depth, -1, -1):
+            for _ in range(rnd.randint(1, 8)):
+                lines.append('> ' * level + 'some text of the message %d' % len(lines))
+        lines.append('')
+    return '\n'.join(lines)
+
+
+def build_deep():
+    # a long chain of replies quoting each other
+    return '\n'.join('>' * level + ' reply %d' % level for level in range(1, DEEP_LEVELS))
+
+
+def measure(func, text):
+    try:
+        start = perf_counter()
+        func(text)
+        elapsed = perf_counter() - start
+    except RecursionError:
+        return 'RecursionError'
+
+    tracemalloc.start()
+    func(text)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return '%8.1f ms %8.1f MB peak' % (elapsed * 1000, peak / 1e6)
+
+
+def main():
+    for name, text in (
+        ('digest', build_digest()),
+        ('deep', build_deep()),
+    ):
+        print('%s, %d lines, recursion limit %d' % (name, text.count('\n') + 1, sys.getrecursionlimit()))
+        print('  %-8s %s' % ('tree', measure(lambda text: tree_to_text(TreeParser().parse(text)), text)))
+        print('  %-8s %s' % ('events', measure(lambda text: to_text(parse_events(text)), text)))
+
+
+if __name__ == '__main__':
+    main()
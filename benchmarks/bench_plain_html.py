@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# this project is licensed under the WTFPLv2, see COPYING.wtfpl for details
+
+# compare rendering plain text bodies as HTML line by line (as done before)
+# and in one pass over the whole body, on several kinds of bodies
+# run with: python benchmarks/bench_plain_html.py
+
+import random
+from timeit import repeat
+
+from lierre.mailutils.parsequote import parse_events, OPEN, LINE
+from lierre.mailutils.plain_html import line_to_html, plain_to_html
+
+
+LINES = 20000
+
+WORDS = ['lorem', 'ipsum', 'dolor', 'sit', 'amet', 'consectetur', 'adipiscing', 'elit', 'sed', 'do']
+
+
+def line_by_line(body):
+    # what was done before rendering in one pass
+    full_html = ['<p>\n']
+
+    for kind, value in parse_events(body):
+        if kind is LINE:
+            full_html.append('  ' * value.level)
+            full_html.append(line_to_html(value.text))
+            full_html.append('<br/>')
+        elif not value:
+            continue
+        elif kind is OPEN:
+            full_html.append('</p>\n<blockquote>\n<p>\n')
+        else:
+            full_html.append('</p>\n</blockquote>\n<p>\n')
+
+    full_html.append('</p>\n')
+    return ''.join(full_html)
+
+
+def build_bodies():
+    rnd = random.Random(0)
+
+    def words(n):
+        return ' '.join(rnd.choice(WORDS) for _ in range(n))
+
+    return {
+        'prose': '\n'.join(words(12) for _ in range(LINES)),
+        'links': '\n'.join(
+            '%s https://example.com/%s?id=%d&x=<y> %s' % (words(3), rnd.choice(WORDS), n, words(3))
+            for n in range(LINES)
+        ),
+        'spaces': '\n'.join(
+            '    %-12s %8d    %s' % (rnd.choice(WORDS), n, words(2))
+            for n in range(LINES)
+        ),
+        'quoted': '\n'.join(
+            '> ' * rnd.randint(0, 4) + words(10)
+            for _ in range(LINES)
+        ),
+    }
+
+
+def main():
+    for name, body in build_bodies().items():
+        assert line_by_line(body) == plain_to_html(body)
+
+        print('%s, %d lines' % (name, LINES))
+        for func in (line_by_line, plain_to_html):
+            elapsed = min(repeat(lambda: func(body), number=1, repeat=5))
+            print('  %-14s %8.1f ms' % (func.__name__, elapsed * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# this project is licensed under the WTFPLv2, see COPYING.wtfpl for details
+
+# compare scrolling a threads list when tags are drawn on every paint vs
+# blitted from cached chips
+# run with: QT_QPA_PLATFORM=offscreen python benchmarks/bench_tag_chips.py
+
+import random
+from time import perf_counter
+
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QFontMetrics, QPen, QStandardItem, QStandardItemModel
+from PyQt5.QtWidgets import QApplication, QStyle, QTreeView
+
+from lierre.ui.models import MaildirFlags, tag_to_colors
+from lierre.ui.threads_widget import ThreadSubjectDelegate
+
+
+ROWS = 5000
+
+TAGS = ['inbox', 'unread', 'replied', 'flagged', 'attachment', 'lists/python', 'lists/qt', 'work', 'family', 'todo']
+
+
+class ThreadsModel(QStandardItemModel):
+    ThreadFlagsRole = Qt.UserRole + 1
+    ThreadTagsRole = Qt.UserRole + 2
+
+
+class PaintEachTimeDelegate(ThreadSubjectDelegate):
+    # what was done before caching chips
+    def paint(self, painter, option, qidx):
+        self.initStyleOption(option, qidx)
+
+        tags = qidx.sibling(qidx.row(), 0).data(qidx.model().ThreadTagsRole)
+
+        painter.save()
+        try:
+            if option.state & QStyle.State_Selected:
+                painter.setBackground(option.palette.highlight())
+            else:
+                painter.setBackground(option.palette.base())
+            painter.eraseRect(option.rect)
+
+            painter.setClipRect(option.rect)
+            painter.translate(option.rect.topLeft())
+            painter.setFont(option.font)
+
+            fm = QFontMetrics(option.font)
+
+            x = self.xmargin
+            for tag in tags:
+                sz = QFontMetrics(option.font).size(Qt.TextSingleLine, tag)
+                fg, bg = tag_to_colors(tag)
+                painter.setPen(fg.color())
+
+                painter.fillRect(x, self.ymargin, sz.width() + 2 * self.xpadding, fm.height(), bg.color())
+                painter.drawText(x + self.xpadding, self.ymargin + fm.ascent(), tag)
+                x += sz.width() + self.xmargin + 2 * self.xpadding
+
+            painter.setPen(QPen(option.palette.text(), 1))
+            painter.drawText(x + self.xpadding, self.ymargin + fm.ascent(), qidx.data())
+        finally:
+            painter.restore()
+
+
+def build_model():
+    rnd = random.Random(0)
+    model = ThreadsModel()
+    for n in range(ROWS):
+        tags = sorted(rnd.sample(TAGS, rnd.randint(1, 5)))
+        item = QStandardItem('subject of thread %d' % n)
+        item.setData(MaildirFlags.tags_to_flags(tags), ThreadsModel.ThreadFlagsRole)
+        item.setData(tags, ThreadsModel.ThreadTagsRole)
+        model.appendRow(item)
+    return model
+
+
+def scroll(view):
+    bar = view.verticalScrollBar()
+    start = perf_counter()
+    for value in range(0, bar.maximum() + 1, bar.pageStep()):
+        bar.setValue(value)
+        view.viewport().repaint()
+    return perf_counter() - start
+
+
+def main():
+    app = QApplication([])
+    model = build_model()
+
+    for name, delegate in (
+        ('paint each time', PaintEachTimeDelegate()),
+        ('cached chips', ThreadSubjectDelegate()),
+    ):
+        view = QTreeView()
+        view.setUniformRowHeights(True)
+        view.setModel(model)
+        view.setItemDelegateForColumn(0, delegate)
+        view.resize(800, 600)
+        view.show()
+        app.processEvents()
+
+        scroll(view)  # warm caches
+        elapsed = min(scroll(view) for _ in range(3))
+        print('%-16s %8.1f ms for %d rows' % (name, elapsed * 1000, ROWS))
+
+        view.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+# this project is licensed under the WTFPLv2, see COPYING.wtfpl for details
+
+# compare memory used by threads list rows stored as dicts vs ThreadRow
+# run with: python benchmarks/bench_thread_rows.py
+
+import random
+import tracemalloc
+
+from lierre.ui.models import ThreadRow
+
+
+THREADS = 100000
+
+TAGS = ['inbox', 'unread', 'replied', 'flagged', 'attachment', 'lists/python', 'lists/qt', 'work', 'family', 'todo']
+
+
+def iter_threads():
+    rnd = random.Random(0)
+    for n in range(THREADS):
+        yield dict(
+            id='%016x' % n,
+            authors='Someone <someone%d@example.com>' % (n % 500),
+            subject='subject of thread %d' % n,
+            messages_count=rnd.randint(1, 20),
+            last_update=1500000000 + n,
+            # notmuch gives new strings for each thread
+            tags=[tag.encode('ascii').decode('ascii') for tag in rnd.sample(TAGS, rnd.randint(1, 5))],
+        )
+
+
+def measure(build):
+    # only what is kept by rows is still traced at the end
+    tracemalloc.start()
+    rows = [build(value) for value in iter_threads()]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    del rows
+    return size
+
+
+def main():
+    # dicts are what was done before ThreadRow
+    dict_size = measure(lambda value: value)
+    row_size = measure(lambda value: ThreadRow(**value))
+
+    print('%-10s %8.1f MB' % ('dicts', dict_size / 1e6))
+    print('%-10s %8.1f MB' % ('ThreadRow', row_size / 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -5,8 +5,12 @@ from PyQt5.QtWidgets import QApplication
 
 from . import __version__
 from . import plugin_manager
+from .builtins.filters.base import ThreadedJob
 from .config import read_config, write_config
 from .ui.error_logs import install as install_log_handler
+from .ui.message_renderer import MESSAGE_RENDERER
+from .utils.db_ops import EXCERPT_BUILDER
+from .utils.tag_stats import TAG_STATS
 
 
 class Application(QApplication):
@@ -27,3 +31,8 @@ class Application(QApplication):
     @Slot()
     def _on_quit(self):
         write_config()
+        EXCERPT_BUILDER.shutdown()
+        MESSAGE_RENDERER.shutdown()
+        TAG_STATS.shutdown()
+        # don't leave the database while a filter writes it
+        ThreadedJob.cancel_all()
@@ -1,5 +1,16 @@
 # this project is licensed under the WTFPLv2, see COPYING.wtfpl for details
 
+from logging import getLogger
+import threading
+
+from PyQt5.QtCore import QThread, pyqtSlot as Slot
+
+from ..fetchers.base import Job
+
+
+LOGGER = getLogger(__name__)
+
+
 class Plugin:
     def __init__(self):
         pass
@@ -18,3 +29,80 @@ class Plugin:
 
     def run(self):
         raise NotImplementedError()
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobThread(QThread):
+    def __init__(self, job, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.job = job
+        self.status = 0
+
+    def run(self):
+        try:
+            self.job.run()
+        except JobCancelled:
+            LOGGER.info('job %r was cancelled', self.job)
+            self.status = 1
+        except Exception:
+            LOGGER.exception('job %r failed', self.job)
+            self.status = 1
+
+
+class ThreadedJob(Job):
+    """Job running in a separate thread, so the GUI is not blocked
+
+    Subclasses implement run(), which must not touch widgets. It can report
+    progress with set_progress() and should call check_cancelled() between
+    steps.
+    """
+
+    # jobs being run, to be cancelled when quitting
+    RUNNING = set()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._job_thread = None
+        self.cancelled = threading.Event()
+
+    def start(self):
+        self._job_thread = JobThread(self, parent=self)
+        self._job_thread.finished.connect(self._threadFinished)
+        self.RUNNING.add(self)
+        self._job_thread.start()
+
+    def run(self):
+        raise NotImplementedError()
+
+    def cancel(self):
+        # can be called from any thread
+        self.cancelled.set()
+
+    def is_cancelled(self):
+        return self.cancelled.is_set()
+
+    def check_cancelled(self):
+        if self.cancelled.is_set():
+            raise JobCancelled()
+
+    def set_progress(self, done, total):
+        # progress is connected to slots of the GUI thread, they are queued
+        self.progress.emit(done * 100 // total if total else 100)
+        self.check_cancelled()
+
+    @Slot()
+    def _threadFinished(self):
+        # finished is emitted just before the thread ends
+        self._job_thread.wait()
+        self.RUNNING.discard(self)
+        self.finished.emit(self._job_thread.status)
+
+    @classmethod
+    def cancel_all(cls):
+        for job in list(cls.RUNNING):
+            job.cancel()
+        for job in list(cls.RUNNING):
+            job._job_thread.wait()
@@ -1,19 +1,26 @@
 # this project is licensed under the WTFPLv2, see COPYING.wtfpl for details
 
 from time import time
-import mailbox
 from pathlib import Path
 
-from lierre.utils.db_ops import open_db_rw, get_db_path, get_thread_by_id
+from lierre.utils.db_ops import open_db_rw, open_private_db, get_thread_by_id
 from lierre.utils.maildir_ops import MaildirPP
 
-from ..fetchers.base import Plugin, Job
+from ..fetchers.base import Plugin
+from .base import ThreadedJob
 
 
 THRESHOLD = 24 * 60 * 60
+# messages moved while holding the write lock
+MOVE_CHUNK = 50
 
 
 class ThreadToDirPlugin(Plugin):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # db.get_revision() when the last job started
+        self.revision = None
+
     def get_config(self):
         return self.config
 
@@ -21,42 +28,86 @@ class ThreadToDirPlugin(Plugin):
         self.config = config
 
     def create_job(self):
-        return MoveJob()
+        return MoveJob(self)
 
 
-class MoveJob(Job):
-    def start(self):
-        now = time()
-        mailroot = get_db_path()
-        box = mailbox.Maildir(mailroot)
+class MoveJob(ThreadedJob):
+    def __init__(self, plugin, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.plugin = plugin
 
-        # TODO: folder:"" and thread:{not folder:""}?
-        with open_db_rw() as db:
-            for msgname in box.iterkeys():
-                msg_path = Path(mailroot).joinpath(box._lookup(msgname))
+    def run(self):
+        root = MaildirPP()
 
-                if now - msg_path.stat().st_mtime >= THRESHOLD:
-                    continue
+        # the write lock is only taken for moving, the GUI thread may write
+        # to the db meanwhile
+        with open_private_db() as db:
+            revision = db.get_revision()
+            query = db.create_query(build_query(self.plugin.revision, revision, time()))
 
-                if 'deleted' in set(db.find_message_by_filename(str(msg_path)).get_tags()):
-                    continue
+            # paths are gathered first, moving them changes the messages
+            threads = group_by_thread(root, query.search_messages())
 
-                try_place_in_folder(db, msg_path)
+            moves = []
+            for thread_id, msg_paths in threads.items():
+                self.check_cancelled()
+                top_paths = get_top_paths(db, thread_id)
+                for msg_path in msg_paths:
+                    folder = find_folder(root, msg_path, top_paths)
+                    if folder is not None:
+                        moves.append((msg_path, folder))
 
-        self.finished.emit(0)
+        move_in_chunks(root, moves, self.set_progress)
 
+        self.plugin.revision = revision
 
-def try_place_in_folder(db, msg_path):
-    root = MaildirPP()
 
-    msg = db.find_message_by_filename(str(msg_path))
+def build_query(last_revision, revision, now):
+    """Return query of messages of the root folder from the last THRESHOLD seconds
+
+    Revisions are (revision, uuid) as returned by db.get_revision().
+    If last_revision can be compared, only messages changed since are
+    returned.
+    """
+
+    # lastmod: alone would also return old messages whose tags changed,
+    # e.g. a reply the user moved away on purpose
+    query = 'date:@%d..' % (now - THRESHOLD)
+    if last_revision is not None and last_revision[1] == revision[1] and last_revision[0] <= revision[0]:
+        query = 'lastmod:%d..%d and %s' % (last_revision[0] + 1, revision[0], query)
+
+    # messages already filed in subfolders are left where they are
+    return '(%s) and folder:"" and not tag:deleted' % query
+
+
+def group_by_thread(root, messages):
+    """Return {thread_id: [paths of messages in the root folder]}
+
+    A message may have other files in subfolders, they are not returned.
+    """
+
+    threads = {}
+    for msg in messages:
+        paths = [
+            msg_path for msg_path in map(Path, msg.get_filenames())
+            if not root.folder_from_msg(msg_path).parts
+        ]
+        if paths:
+            threads.setdefault(msg.get_thread_id(), []).extend(paths)
+    return threads
+
+
+def get_top_paths(db, thread_id):
+    thread = get_thread_by_id(db, thread_id)
+    # TODO: in what case multiple toplevel messages?
+    # TODO: multiple filenames for toplevel message?
+    return [Path(toplevel.get_filename()) for toplevel in thread.get_toplevel_messages()]
+
 
-    thread = get_thread_by_id(db, msg.get_thread_id())
-    for toplevel in thread.get_toplevel_messages():
-        # TODO: in what case multiple toplevel messages?
-        # TODO: multiple filenames for toplevel message?
-        top_path = Path(toplevel.get_filename())
+def find_folder(root, msg_path, top_paths):
+    """Return the folder of top_paths if msg_path is not in it, else None"""
 
+    for top_path in top_paths:
         if msg_path.parent == top_path.parent:
             continue
 
@@ -64,8 +115,38 @@ def try_place_in_folder(db, msg_path):
             # maildir: one may be in 'new' and the other in 'cur'
             continue
 
-        new_path = root.move_message(msg_path, root.folder_from_msg(top_path))
+        return root.folder_from_msg(top_path)
 
-        db.add_message(str(new_path))
-        db.remove_message(str(msg_path))
-        break
+    return None
+
+
+def find_thread_folder(db, root, msg_path):
+    """Return the folder of the thread of msg_path if msg_path is not in it, else None"""
+
+    msg = db.find_message_by_filename(str(msg_path))
+    return find_folder(root, msg_path, get_top_paths(db, msg.get_thread_id()))
+
+
+def move_in_chunks(root, moves, progress=None):
+    """Move messages, releasing the write lock after every MOVE_CHUNK messages
+
+    The GUI can write to the db between chunks instead of failing to get
+    the lock for the whole batch.
+    """
+
+    for start in range(0, len(moves), MOVE_CHUNK):
+        chunk = moves[start:start + MOVE_CHUNK]
+
+        def chunk_progress(done, _):
+            if progress:
+                progress(start + done, len(moves))
+
+        with open_db_rw() as db:
+            root.move_messages(chunk, db, chunk_progress)
+
+
+def try_place_in_folder(db, msg_path):
+    root = MaildirPP()
+    folder = find_thread_folder(db, root, msg_path)
+    if folder is not None:
+        root.move_messages([(msg_path, folder)], db)
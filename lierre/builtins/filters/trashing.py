@@ -3,9 +3,9 @@
 from logging import getLogger
 from pathlib import Path
 
-from PyQt5.QtCore import QTimer, pyqtSlot as Slot, QThread, Qt
+from PyQt5.QtCore import QTimer, pyqtSignal as Signal, pyqtSlot as Slot, QThread, Qt
 from lierre.utils.db_ops import open_db_rw
-from lierre.utils.maildir_ops import MaildirPP
+from lierre.utils.maildir_ops import MaildirPP, MoveResult
 from lierre.change_watcher import WATCHER
 
 from ..fetchers.base import Plugin, Job
@@ -23,8 +23,7 @@ class TrashingPlugin(Plugin):
         self.periodic_thread = None
 
     def enable(self):
-        WATCHER.tagMailAdded.connect(self.tagMailAdded, Qt.QueuedConnection)
-        WATCHER.tagMailRemoved.connect(self.tagMailRemoved, Qt.QueuedConnection)
+        WATCHER.tagsChanged.connect(self.tagsChanged, Qt.QueuedConnection)
 
         self.timer = QTimer(parent=self)
         self.timer.setSingleShot(True)
@@ -33,8 +32,7 @@ class TrashingPlugin(Plugin):
         self.timer.start()
 
     def disable(self):
-        WATCHER.tagMailAdded.disconnect(self.tagMailAdded)
-        WATCHER.tagMailRemoved.disconnect(self.tagMailRemoved)
+        WATCHER.tagsChanged.disconnect(self.tagsChanged)
         if self.periodic_thread:
             self.periodic_thread.finished.disconnect(self.timer.start)
         self.timer.stop()
@@ -51,31 +49,22 @@ class TrashingPlugin(Plugin):
         return SearchTrashableJob(self.build_processor(), dry_run=self.config['dry_run'])
 
     # trash messages directly if tags are set by UI
-    @Slot(str, str)
-    def tagMailAdded(self, tag, msg_id):
-        if tag != TAG_DELETED:
+    @Slot(object)
+    def tagsChanged(self, changes):
+        deleted = [msg_id for msg_id, (added, _) in changes.items() if TAG_DELETED in added]
+        undeleted = [msg_id for msg_id, (_, removed) in changes.items() if TAG_DELETED in removed]
+        if not deleted and not undeleted:
             return
 
         processor = self.build_processor()
         with open_db_rw() as db:
-            for msg_path in db.find_message(msg_id).get_filenames():
-                msg_path = Path(msg_path)
-                LOGGER.info('deleting message %r with path %r', msg_id, msg_path)
-                if not self.config['dry_run']:
-                    processor.delete_message(db, msg_path)
-
-    @Slot(str, str)
-    def tagMailRemoved(self, tag, msg_id):
-        if tag != TAG_DELETED:
-            return
+            # paths are gathered first, moving them changes the messages
+            to_delete = list(iter_paths((db.find_message(msg_id) for msg_id in deleted), 'deleting'))
+            to_undelete = list(iter_paths((db.find_message(msg_id) for msg_id in undeleted), 'undeleting'))
 
-        processor = self.build_processor()
-        with open_db_rw() as db:
-            for msg_path in db.find_message(msg_id).get_filenames():
-                msg_path = Path(msg_path)
-                LOGGER.info('undeleting message %r with path %r', msg_id, msg_path)
-                if not self.config['dry_run']:
-                    processor.undelete_message(db, msg_path)
+            if not self.config['dry_run']:
+                processor.delete_messages(db, to_delete)
+                processor.undelete_messages(db, to_undelete)
 
     # trash messages periodically if they are set by notmuch or while app is not run
     @Slot()
@@ -104,6 +93,7 @@ class SearchTrashableJob(Job):
 
     def start(self):
         self.job = SearchTrashableThread(self.processor, dry_run=self.dry_run)
+        self.job.progress.connect(self.progress)
         self.job.finished.connect(self._finished)
         self.job.start()
 
@@ -120,19 +110,38 @@ class SearchTrashableThread(QThread):
 
     def run(self):
         with open_db_rw() as db:
-            for msg in self.processor.find_messages_to_delete(db):
-                for msg_path in msg.get_filenames():
-                    msg_path = Path(msg_path)
-                    LOGGER.info('deleting message %r with path %r', msg.get_message_id(), msg_path)
-                    if not self.dry_run:
-                        self.processor.delete_message(db, msg_path)
+            # paths are gathered first, moving them changes the query results
+            to_delete = list(iter_paths(self.processor.find_messages_to_delete(db), 'deleting'))
+            to_undelete = list(iter_paths(self.processor.find_messages_to_undelete(db), 'undeleting'))
+
+            if self.dry_run:
+                return
+
+            total = len(to_delete) + len(to_undelete)
+            self.processor.delete_messages(
+                db, to_delete,
+                lambda done, _: self.progress.emit(done * 100 // total),
+            )
+            self.processor.undelete_messages(
+                db, to_undelete,
+                lambda done, _: self.progress.emit((len(to_delete) + done) * 100 // total),
+            )
+
+    progress = Signal(int)
+
 
-            for msg in self.processor.find_messages_to_undelete(db):
-                for msg_path in msg.get_filenames():
-                    msg_path = Path(msg_path)
-                    LOGGER.info('undeleting message %r with path %r', msg.get_message_id(), msg_path)
-                    if not self.dry_run:
-                        self.processor.undelete_message(db, msg_path)
+def iter_paths(messages, action):
+    for msg in messages:
+        for msg_path in msg.get_filenames():
+            msg_path = Path(msg_path)
+            LOGGER.info('%s message %r with path %r', action, msg.get_message_id(), msg_path)
+            yield msg_path
+
+
+def log_moves(result, action):
+    if result.failed:
+        LOGGER.error('%s: %d messages moved, %d failed', action, len(result.moved), len(result.failed))
+    return result
 
 
 class TrashFolderProcessor:
@@ -154,10 +163,14 @@ class TrashFolderProcessor:
         return q.search_messages()
 
     def delete_message(self, db, msg_path: Path) -> None:
-        LOGGER.debug('trashing %r to %r', msg_path, self.trash_folder.path)
-        new_path = self.root.move_message(msg_path, self.trash_folder)
-        db.add_message(str(new_path))
-        db.remove_message(str(msg_path))
+        self.delete_messages(db, [msg_path])
+
+    def delete_messages(self, db, msg_paths, progress=None) -> MoveResult:
+        LOGGER.debug('trashing %d messages to %r', len(msg_paths), self.trash_folder.path)
+        result = self.root.move_messages(
+            ((msg_path, self.trash_folder) for msg_path in msg_paths), db, progress,
+        )
+        return log_moves(result, 'trashing')
 
     def expunge_message(self, db, msg_path: Path) -> None:
         LOGGER.error('expunging %r', msg_path)
@@ -165,10 +178,15 @@ class TrashFolderProcessor:
         db.remove_message(db.find_message(str(msg_path)))
 
     def undelete_message(self, db, msg_path: Path) -> None:
-        LOGGER.error('untrashing %r to inbox', msg_path)
-        new_path = self.root.move_message(msg_path, self.root.get_root())
-        db.add_message(str(new_path))
-        db.remove_message(str(msg_path))
+        self.undelete_messages(db, [msg_path])
+
+    def undelete_messages(self, db, msg_paths, progress=None) -> MoveResult:
+        LOGGER.error('untrashing %d messages to inbox', len(msg_paths))
+        root = self.root.get_root()
+        result = self.root.move_messages(
+            ((msg_path, root) for msg_path in msg_paths), db, progress,
+        )
+        return log_moves(result, 'untrashing')
 
 
 class TrashFlagProcessor:
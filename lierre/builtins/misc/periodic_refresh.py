@@ -48,10 +48,10 @@ class PeriodicRefreshPlugin:
         self.refresher.start()
 
         # reset timer if manually triggered
-        WATCHER.globalRefresh.connect(self.refresher.start)
+        WATCHER.fetchFinished.connect(self.refresher.start)
 
     def disable(self):
-        WATCHER.globalRefresh.disconnect(self.refresher.start)
+        WATCHER.fetchFinished.disconnect(self.refresher.start)
         self.refresher.stop()
         self.refresher = None
 
@@ -4,7 +4,7 @@ import heapq
 import itertools
 
 from PyQt5.QtCore import (
-    QObject, pyqtSignal as Signal
+    QObject, QBasicTimer, pyqtSignal as Signal, pyqtSlot as Slot,
 )
 
 
@@ -27,10 +27,106 @@ def diff_sorted(aitems, bitems, *, key=None, reverse=False):
             yield (v, v)
 
 
+def count_all_messages(db):
+    query = db.create_query('*')
+    if hasattr(query, 'set_omit_excluded'):
+        # FIXME remove condition when function is integrated in notmuch bindings
+        query.set_omit_excluded(query.EXCLUDE.FALSE)
+    return query.count_messages()
+
+
 class ChangeWatcher(QObject):
+    def __init__(self, *args, **kwargs):
+        super(ChangeWatcher, self).__init__(*args, **kwargs)
+
+        # {msg_id: (added tags, removed tags)} not notified yet
+        self.tag_changes = {}
+        self.timer = QBasicTimer()
+
+        self.tagMailAdded.connect(self._tagAdded)
+        self.tagMailRemoved.connect(self._tagRemoved)
+
+    def _tagChanges(self, msg_id):
+        if not self.timer.isActive():
+            # everything emitted until the event loop runs again is batched
+            self.timer.start(0, self)
+        return self.tag_changes.setdefault(msg_id, (set(), set()))
+
+    @Slot(str, str)
+    def _tagAdded(self, tag, msg_id):
+        added, removed = self._tagChanges(msg_id)
+        removed.discard(tag)
+        added.add(tag)
+
+    @Slot(str, str)
+    def _tagRemoved(self, tag, msg_id):
+        added, removed = self._tagChanges(msg_id)
+        added.discard(tag)
+        removed.add(tag)
+
+    def timerEvent(self, ev):
+        if ev.timerId() != self.timer.timerId():
+            super(ChangeWatcher, self).timerEvent(ev)
+            return
+
+        self.timer.stop()
+        changes, self.tag_changes = self.tag_changes, {}
+        self.tagsChanged.emit(changes)
+
+    def getRevision(self):
+        from lierre.utils.db_ops import open_db
+
+        with open_db() as db:
+            revision, uuid = db.get_revision()
+            return revision, uuid, count_all_messages(db)
+
+    def emitChangesSince(self, revision):
+        from lierre.utils.db_ops import open_db
+
+        old, old_uuid, old_count = revision
+        with open_db() as db:
+            new, uuid = db.get_revision()
+            if uuid != old_uuid or new < old:
+                # db was rebuilt, revisions can't be compared
+                self.globalRefresh.emit()
+                return
+            elif new == old:
+                return
+            elif count_all_messages(db) < old_count:
+                # removed messages are not in the db anymore, no query
+                # can find them or their threads
+                # (if more were added than removed, views find out when
+                # opening a removed thread)
+                self.globalRefresh.emit()
+                return
+
+            query = db.create_query('lastmod:%d..%d' % (old + 1, new))
+            if hasattr(query, 'set_omit_excluded'):
+                # FIXME remove condition when function is integrated in notmuch bindings
+                query.set_omit_excluded(query.EXCLUDE.FALSE)
+
+            message_ids = []
+            thread_ids = set()
+            for msg in query.search_messages():
+                message_ids.append(msg.get_message_id())
+                thread_ids.add(msg.get_thread_id())
+
+        self.threadsChanged.emit(sorted(thread_ids))
+        self.messagesChanged.emit(message_ids)
+
+    # everything must be refreshed
     globalRefresh = Signal()
+    # a fetch finished, changes are notified by other signals
+    fetchFinished = Signal()
+    # threads/messages were changed by another process (e.g. notmuch new)
+    threadsChanged = Signal(list)
+    messagesChanged = Signal(list)
+    # emit these when changing a tag, subscribers should rather use tagsChanged
     tagMailAdded = Signal(str, str)
     tagMailRemoved = Signal(str, str)
+    # tag changes gathered during an event loop turn
+    # {msg_id: (added tags, removed tags)}
+    tagsChanged = Signal(object)
     mailAdded = Signal(str)
 
 
@@ -1,5 +1,6 @@
 # this project is licensed under the WTFPLv2, see COPYING.wtfpl for details
 
+from configparser import ConfigParser
 from logging import getLogger
 import os
 from pathlib import Path
@@ -70,3 +71,51 @@ CONFIG = ConfigDict()
 
 def get_notmuch_config_path():
     return os.environ.get('NOTMUCH_CONFIG', str(Path.home().joinpath('.notmuch-config')))
+
+
+class NotmuchConfigCache:
+    def __init__(self):
+        self.key = None
+        self.parser = None
+        self.excluded_tags = ()
+
+    def get(self):
+        path = get_notmuch_config_path()
+        try:
+            st = os.stat(path)
+        except OSError:
+            key = (path, None, None)
+        else:
+            key = (path, st.st_mtime_ns, st.st_size)
+
+        if key != self.key:
+            self._read(path)
+            self.key = key
+
+        return self
+
+    def _read(self, path):
+        LOGGER.debug('reading notmuch config: %s', path)
+        self.parser = ConfigParser(interpolation=None)
+        try:
+            with open(path) as fd:
+                self.parser.read_file(fd)
+        except OSError:
+            pass
+
+        self.excluded_tags = tuple(filter(None, self.parser.get('search', 'exclude_tags', fallback='').split(';')))
+
+
+NOTMUCH_CONFIG = NotmuchConfigCache()
+
+
+def get_notmuch_config():
+    """Return the parsed notmuch config, it must not be modified
+
+    The file is parsed again only if it changed since the last call.
+    """
+    return NOTMUCH_CONFIG.get().parser
+
+
+def get_notmuch_excluded_tags():
+    return NOTMUCH_CONFIG.get().excluded_tags
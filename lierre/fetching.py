@@ -18,9 +18,12 @@ class Fetcher(QObject):
     def __init__(self):
         super(Fetcher, self).__init__()
         self.queue = []
+        self.revision = None
+        self.job = None
 
     def start(self):
         self.queue = []
+        self.revision = WATCHER.getRevision()
 
         for plugin in plugin_manager.PLUGINS['fetchers'].iter_enabled_plugins().values():
             self.queue.append(plugin.create_job())
@@ -34,6 +37,7 @@ class Fetcher(QObject):
 
     def start_only(self, fetcher_name, **kwargs):
         self.queue = []
+        self.revision = WATCHER.getRevision()
 
         for plugin_name, plugin in plugin_manager.PLUGINS['fetchers'].iter_enabled_plugins().items():
             if plugin_name == fetcher_name:
@@ -49,11 +53,20 @@ class Fetcher(QObject):
 
         self._start_job(self.queue.pop(0))
 
+    def cancel(self):
+        # jobs not supporting cancellation are run until their end
+        self.queue = []
+        if hasattr(self.job, 'cancel'):
+            self.job.cancel()
+
     def _start_job(self, job):
+        self.job = job
         if not job.parent():
             job.setParent(self)
         job.finished.connect(self._job_finished)
         job.finished.connect(job.deleteLater)
+        job.progress.connect(self.progress)
+        self.progress.emit(-1)
         job.start()
 
     @Slot()
@@ -62,9 +75,11 @@ class Fetcher(QObject):
             job = self.queue.pop(0)
             self._start_job(job)
         else:
+            self.job = None
             self.finished.emit()
-            WATCHER.globalRefresh.emit()
-
-    # TODO progress bar info
+            WATCHER.fetchFinished.emit()
+            WATCHER.emitChangesSince(self.revision)
 
     finished = Signal()
+    # percentage of the current job, -1 until it tells
+    progress = Signal(int)
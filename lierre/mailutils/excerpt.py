@@ -0,0 +1,192 @@
+# this project is licensed under the WTFPLv2, see COPYING.wtfpl for details
+
+# Build a short excerpt of a mail body without parsing the whole mail:
+# MIME parts are streamed line by line, only headers of parts are parsed,
+# attachments payloads are skipped without being decoded, and reading stops
+# as soon as the first text/plain part gave enough characters.
+
+import binascii
+import codecs
+import email.policy
+from email.parser import BytesParser
+import quopri
+import re
+
+try:
+    from html2text import HTML2Text
+    HAS_HTML2TEXT = True
+except ImportError:
+    HAS_HTML2TEXT = False
+
+
+EXCERPT_LENGTH = 100
+
+# html can't be truncated after conversion, so bound the html read instead
+HTML_MAX_LENGTH = 64 * 1024
+
+HEADERS_PARSER = BytesParser(policy=email.policy.default)
+
+
+class PartsReader:
+    def __init__(self, fp):
+        self.fp = fp
+        # delimiters of the enclosing multiparts, innermost last
+        self.boundaries = []
+        # (depth, is_closing) of the last delimiter line found, None if EOF
+        self.last = None
+
+    def read_headers(self):
+        lines = []
+        for line in self.fp:
+            if not line.strip():
+                break
+            lines.append(line)
+        return HEADERS_PARSER.parsebytes(b''.join(lines), headersonly=True)
+
+    def _match_boundary(self, line):
+        line = line.rstrip()
+        for depth in range(len(self.boundaries) - 1, -1, -1):
+            boundary = self.boundaries[depth]
+            if line == boundary:
+                return depth, False
+            elif line == boundary + b'--':
+                return depth, True
+
+    def body_lines(self):
+        self.last = None
+        for line in self.fp:
+            if self.boundaries and line.startswith(b'--'):
+                self.last = self._match_boundary(line)
+                if self.last is not None:
+                    return
+            yield line
+
+    def _skip(self):
+        for _ in self.body_lines():
+            pass
+
+    def walk(self, headers, selected=True):
+        """Yield (headers, body lines iterator) of leaf parts, depth-first
+
+        Like EmailMessage.get_body, attachments and non-first parts of
+        multipart/related are not considered, but still need to be skipped.
+        """
+
+        if headers.get_content_disposition() == 'attachment':
+            selected = False
+
+        boundary = headers.get_boundary()
+        if headers.get_content_maintype() != 'multipart' or not boundary:
+            lines = self.body_lines()
+            if selected:
+                yield headers, lines
+            # consume what the caller did not read
+            for _ in lines:
+                pass
+            return
+
+        self.boundaries.append(b'--' + boundary.encode('ascii', 'replace'))
+        depth = len(self.boundaries) - 1
+        self._skip()  # preamble
+
+        related = headers.get_content_subtype() == 'related'
+        first = True
+        while self.last == (depth, False):
+            yield from self.walk(self.read_headers(), selected and not (related and not first))
+            first = False
+
+        self.boundaries.pop()
+        if self.last == (depth, True):
+            self._skip()  # epilogue
+
+
+def iter_decoded(headers, lines):
+    """Decode body lines of a text part, like EmailMessage.get_content does"""
+
+    cte = headers.get('content-transfer-encoding', '').strip().lower()
+
+    charset = headers.get_param('charset', 'ascii')
+    try:
+        decoder = codecs.getincrementaldecoder(charset)(errors='replace')
+    except LookupError:
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+    pending = b''
+    for line in lines:
+        if cte == 'base64':
+            pending += re.sub(rb'[^A-Za-z0-9+/=]', b'', line)
+            size = len(pending) // 4 * 4
+            line, pending = binascii.a2b_base64(pending[:size]), pending[size:]
+        elif cte == 'quoted-printable':
+            line = quopri.decodestring(line)
+
+        yield decoder.decode(line)
+
+    yield decoder.decode(b'', True)
+
+
+def clean_excerpt(text):
+    text = re.sub(r'^>.*$', '', text, flags=re.MULTILINE)
+    return re.sub(r'\s+', ' ', text)
+
+
+def _plain_excerpt(headers, lines, length):
+    parts = []
+    size = 0
+    checked_size = 0
+    for chunk in iter_decoded(headers, lines):
+        parts.append(chunk)
+        size += len(chunk)
+
+        # don't clean the whole text on every line
+        if size > length and size >= checked_size * 2:
+            checked_size = size
+            text = clean_excerpt(''.join(parts))
+            # the cleaned prefix won't change once it is longer than wanted
+            if len(text) > length:
+                return text[:length]
+
+    return clean_excerpt(''.join(parts))[:length]
+
+
+def _read_html(headers, lines):
+    parts = []
+    size = 0
+    for chunk in iter_decoded(headers, lines):
+        parts.append(chunk)
+        size += len(chunk)
+        if size > HTML_MAX_LENGTH:
+            break
+    return ''.join(parts)[:HTML_MAX_LENGTH]
+
+
+def html_to_text(text):
+    converter = HTML2Text()
+    converter.skip_internal_links = True
+    converter.unicode_snob = True
+    converter.ignore_tables = True
+    converter.ignore_images = True
+    return converter.handle(text)
+
+
+def get_excerpt(fp, length=EXCERPT_LENGTH):
+    """Get excerpt of the mail in binary file `fp`
+
+    Returns None if the mail has no text/plain part and html can't be used.
+    """
+
+    reader = PartsReader(fp)
+
+    html = None
+    for headers, lines in reader.walk(reader.read_headers()):
+        ctype = headers.get_content_type()
+        if ctype == 'text/plain':
+            return _plain_excerpt(headers, lines, length)
+        elif ctype == 'text/html' and html is None and HAS_HTML2TEXT:
+            html = _read_html(headers, lines)
+
+    if not HAS_HTML2TEXT:
+        return None
+    if html is None:
+        return ''
+    return re.sub(r'\s+', ' ', html_to_text(html))[:length]
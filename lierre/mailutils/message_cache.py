@@ -0,0 +1,107 @@
+# this project is licensed under the WTFPLv2, see COPYING.wtfpl for details
+
+# Parsed messages and rendered bodies, shared by everything displaying or
+# quoting a message: expanding it again, switching display format, replying
+# or resuming a draft don't read and parse the file again.
+# Entries are keyed by filename and mtime, so a modified file is parsed again.
+# The cache is used from worker threads.
+
+from collections import OrderedDict
+import email
+import email.policy
+import os
+import sys
+from threading import Lock
+
+
+class MessageCache:
+    # rough bound of the memory used by entries, in bytes
+    MAX_SIZE = 64 * 1024 * 1024
+
+    def __init__(self, max_size=None):
+        self.max_size = max_size or self.MAX_SIZE
+        self.lock = Lock()
+        # {key: (value, size)}, least recently used first
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = {'message': 0, 'body': 0}
+        self.misses = {'message': 0, 'body': 0}
+
+    def _stat_key(self, filename):
+        st = os.stat(filename)
+        return (filename, st.st_mtime_ns), st.st_size
+
+    def _get(self, kind, key):
+        with self.lock:
+            try:
+                value, _ = self.entries[key]
+            except KeyError:
+                self.misses[kind] += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits[kind] += 1
+            return value
+
+    def _put(self, key, value, size):
+        with self.lock:
+            if key in self.entries:
+                # built concurrently by another thread
+                return
+
+            self.entries[key] = (value, size)
+            self.size += size
+            while self.size > self.max_size and len(self.entries) > 1:
+                _, (_, old_size) = self.entries.popitem(last=False)
+                self.size -= old_size
+
+    def get_message(self, filename):
+        """Return parsed EmailMessage of filename
+
+        The returned message is shared, it must not be modified.
+        """
+
+        (filename, mtime), file_size = self._stat_key(filename)
+        key = ('message', filename, mtime)
+
+        pymessage = self._get('message', key)
+        if pymessage is None:
+            with open(filename, 'rb') as fp:
+                pymessage = email.message_from_binary_file(fp, policy=email.policy.default)
+            # the parsed message holds about the same data as the file
+            self._put(key, pymessage, file_size)
+        return pymessage
+
+    def get_body(self, filename, display_format, build):
+        """Return (body, is_html) of filename rendered in display_format
+
+        If not cached, `build()` is called to render it.
+        """
+
+        (filename, mtime), _ = self._stat_key(filename)
+        key = ('body', filename, mtime, display_format)
+
+        value = self._get('body', key)
+        if value is None:
+            value = build()
+            body, _ = value
+            self._put(key, value, sys.getsizeof(body) if body else 0)
+        return value
+
+    def stats(self):
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'size': self.size,
+                'max_size': self.max_size,
+                'hits': dict(self.hits),
+                'misses': dict(self.misses),
+            }
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+MESSAGE_CACHE = MessageCache()
@@ -1,5 +1,6 @@
 # this project is licensed under the WTFPLv2, see COPYING.wtfpl for details
 
+from bisect import bisect_left
 import re
 
 
@@ -26,108 +27,163 @@ class Block:
         return f'<%s level=%s content=%s>' % (type(self).__name__, self.level, self.content)
 
 
-class Parser:
-    def __init__(self):
-        self.level = 0
-        self.ret = []
-        self.buf = []
-        self.lines = []
-
-    def _build_lines(self, text):
-        for line in text.splitlines():
-            q = Line()
-            q.original_text = line
-
-            mtc = QUOTING.match(line)
-            if mtc:
-                q.text = line[mtc.end():]
-                q.level = mtc.group().count('>')
-            else:
-                q.text = q.original_text
+# events yielded by iter_events
+OPEN = 'open'
+CLOSE = 'close'
+LINE = 'line'
+
+
+def parse_line(text):
+    q = Line()
+    q.original_text = text
+
+    mtc = QUOTING.match(text)
+    if mtc:
+        q.text = text[mtc.end():]
+        q.level = mtc.group().count('>')
+    else:
+        q.text = text
+    return q
+
+
+def iter_events(lines):
+    """Parse quoting of lines, yield events as lines are read
+
+    Events are (OPEN, level), (LINE, Line) and (CLOSE, level). A block of
+    consecutive lines with the same quoting level is enclosed in OPEN/CLOSE
+    events, blocks of deeper quoting are nested in the block of shallower
+    quoting that follow or precede them. Blocks of level 0 are always at the
+    top.
+
+    A block is not opened for each intermediate level: after "> a" then
+    ">>> b", a block of level 2 may still be opened later around the block of
+    level 3 by a line like ">> c". Events are held back while an open block
+    can be wrapped like this, which doesn't happen with usual quoting.
+    """
+
+    # levels of open blocks, outermost first, always increasing
+    levels = []
+    # position of OPEN event in pending of each open block if it may be
+    # wrapped by a later block, else None
+    positions = []
+    # events not yielded yet
+    pending = []
+    uncertain = 0
+    current = None
+
+    def open_block(level, parent_level):
+        nonlocal uncertain
+
+        position = None
+        if level > parent_level + 1:
+            position = len(pending)
+            uncertain += 1
+        pending.append((OPEN, level))
+        levels.append(level)
+        positions.append(position)
+
+    def close_blocks(start):
+        nonlocal uncertain
+
+        while len(levels) > start:
+            if positions.pop() is not None:
+                uncertain -= 1
+            pending.append((CLOSE, levels.pop()))
+
+    def wrap_block(index, level):
+        nonlocal uncertain
+
+        # the new block starts where the wrapped block started
+        position = positions[index]
+        close_blocks(index)
+        pending.insert(position, (OPEN, level))
+
+        parent_level = levels[index - 1] if index else 0
+        if level > parent_level + 1:
+            uncertain += 1
+        else:
+            position = None
+        levels.append(level)
+        positions.append(position)
 
-            self.lines.append(q)
+    for text in lines:
+        line = parse_line(text)
+        level = line.level
 
-    def parse(self, text):
-        self._build_lines(text)
+        if level != current:
+            current = level
 
-        for q in self.lines:
-            if q.level == self.level:
-                self.buf.append(q)
+            if not levels or not levels[0] or not level:
+                close_blocks(0)
+                open_block(level, 0)
             else:
-                self._dump_buf()
-                self.level = q.level
-                self.buf.append(q)
-
-        if self.buf:
-            self._dump_buf()
-
-        return self.ret
-
-    def _dump_buf(self):
-        if not self.buf:
-            return
-
-        b = Block()
-        b.level = self.buf[-1].level
-        b.content = self.buf
-        self.buf = []
-
-        if not self.level:
-            self.ret.append(b)
-            return
-
-        if not self.ret:
-            self.ret.append(b)
-            return
+                index = bisect_left(levels, level)
+                if index == len(levels):
+                    open_block(level, levels[-1])
+                elif levels[index] == level:
+                    close_blocks(index + 1)
+                else:
+                    wrap_block(index, level)
+
+            if not uncertain:
+                yield from pending
+                pending.clear()
+
+        if uncertain:
+            pending.append((LINE, line))
+        else:
+            yield LINE, line
 
-        last = self.ret[-1]
+    close_blocks(0)
+    yield from pending
 
-        if not last.level:
-            self.ret.append(b)
-            return
 
-        self._dump_buf_recurse(b, self.ret)
+def parse_events(text):
+    return iter_events(text.splitlines())
 
-    def _dump_buf_recurse(self, b, current):
-        last = current[-1]
 
-        if last.level == b.level:
-            last.content.extend(b.content)
-            return
-        if last.level > b.level:
-            current[-1] = b
-            b.content.insert(0, last)
-            return
+class Parser:
+    """Build a tree of Block and Line from iter_events"""
 
-        if isinstance(last, Block):
-            self._dump_buf_recurse(b, last.content)
+    def parse(self, text):
+        ret = []
+        stack = [ret]
+        for kind, value in parse_events(text):
+            if kind is LINE:
+                stack[-1].append(value)
+            elif kind is OPEN:
+                block = Block()
+                block.level = value
+                stack[-1].append(block)
+                stack.append(block.content)
+            else:
+                stack.pop()
+        return ret
+
+
+def indent_events(events, levels=1):
+    for kind, value in events:
+        if kind is LINE:
+            line = Line()
+            line.level = value.level + levels
+            line.text = value.text
+            line.original_text = value.original_text
+            value = line
         else:
-            current.append(b)
-
-
-def indent_recursive(block):
-    block.level += 1
-    if isinstance(block, Block):
-        block.level += 1
-        for sub in block.content:
-            indent_recursive(sub)
+            value += levels
+        yield kind, value
 
 
-def to_text(ls):
+def to_text(events):
     parts = []
+    for kind, value in events:
+        if kind is not LINE:
+            continue
 
-    def recurse(block):
-        if isinstance(block, Line):
-            if block.level:
-                parts.append(('>' * block.level) + ' ' + block.text)
-            else:
-                parts.append(block.text)
+        if value.level:
+            parts.append(('>' * value.level) + ' ' + value.text)
         else:
-            for sub in block.content:
-                recurse(sub)
-
-    for block in ls:
-        recurse(block)
+            parts.append(value.text)
 
     return '\n'.join(parts)
 
@@ -0,0 +1,78 @@
+# this project is licensed under the WTFPLv2, see COPYING.wtfpl for details
+
+# Render plain text mails as HTML: quotes become blockquotes, URLs become
+# links and runs of spaces are kept.
+# Lines of the whole body are escaped and rendered at once, instead of running
+# several regexps on each line.
+
+from itertools import chain
+import html
+import re
+
+from .parsequote import parse_events, OPEN, LINE
+
+
+LINK_RE = re.compile(
+    r'''https?://
+    [][(),'!*$_a-z@.A-Z:0-9/~;?+&=%#-]+  # legal chars in a URL
+    [a-zA-Z0-9/+=#]+  # but we prefer URLs end with those rather than one of the above chars
+    ''', re.VERBOSE,
+)
+
+# runs of spaces, when lines are separated by \n
+SPACES_RE = re.compile(r'[^\S\n][^\S\n]+')
+
+
+def _spaces_to_nbsp(mtc):
+    return '&nbsp;' * len(mtc.group())
+
+
+def _to_link(html_url):
+    url = html.unescape(html_url)
+    return '<a href="{0}">{0}</a>'.format(url)
+
+
+def line_to_html(line):
+    line_html = html.escape(line)
+    line_html = re.sub(r'\s{2,}', _spaces_to_nbsp, line_html)
+    line_html = LINK_RE.sub(lambda mtc: _to_link(mtc.group()), line_html)
+
+    # TODO handle multiline (can't be done in this function)
+    return line_html
+
+
+def lines_to_html(lines):
+    """Return list of line_to_html of each line, rendered in one pass"""
+
+    if not lines:
+        return []
+
+    # same steps as line_to_html, but each one is a single regexp run over
+    # all lines: \n is not a space of runs nor a URL char
+    text = html.escape('\n'.join(lines))
+    text = SPACES_RE.sub(_spaces_to_nbsp, text)
+    text = LINK_RE.sub(lambda mtc: _to_link(mtc.group()), text)
+    return text.split('\n')
+
+
+def plain_to_html(body):
+    # html around each line, then the html after the last line
+    befores = []
+    texts = []
+    before = '<p>\n'
+
+    for kind, value in parse_events(body):
+        if kind is LINE:
+            befores.append(before + '  ' * value.level)
+            texts.append(value.text)
+            before = '<br/>'
+        elif not value:
+            # blocks of level 0 are not quotes
+            continue
+        elif kind is OPEN:
+            before += '</p>\n<blockquote>\n<p>\n'
+        else:
+            before += '</p>\n</blockquote>\n<p>\n'
+
+    full_html = chain.from_iterable(zip(befores, lines_to_html(texts)))
+    return ''.join(full_html) + before + '</p>\n'
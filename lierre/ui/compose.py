@@ -1,6 +1,6 @@
 # this project is licensed under the WTFPLv2, see COPYING.wtfpl for details
 
-import email
+import copy
 from email.message import EmailMessage
 from email.headerregistry import Address
 from email.utils import localtime, getaddresses, make_msgid
@@ -13,7 +13,8 @@ from subprocess import check_output
 from PyQt5.QtCore import pyqtSlot as Slot, pyqtSignal as Signal
 from PyQt5.QtGui import QKeySequence
 from PyQt5.QtWidgets import QWidget, QFileDialog, QAction
-from lierre.mailutils.parsequote import Parser, indent_recursive, to_text
+from lierre.mailutils.message_cache import MESSAGE_CACHE
+from lierre.mailutils.parsequote import parse_events, indent_events, to_text
 from lierre.utils.db_ops import open_db, open_db_rw
 from lierre.utils.maildir_ops import MaildirPP
 from lierre.sending import get_identities, send_email
@@ -114,23 +115,18 @@ class ComposeWidget(QWidget, Ui_Form):
 
         with open_db() as db:
             msg = db.find_message(reply_to)
-            with open(msg.get_filename(), 'rb') as fp:
-                pymessage = email.message_from_binary_file(fp, policy=email.policy.default)
+            pymessage = MESSAGE_CACHE.get_message(msg.get_filename())
 
         body = pymessage.get_body(('plain',))
         if body is not None:
             body = body.get_content()
-            parser = Parser()
-            parsed = parser.parse(body)
-            for block in parsed:
-                indent_recursive(block)
-            self.messageEdit.setPlainText(to_text(parsed))
+            self.messageEdit.setPlainText(to_text(indent_events(parse_events(body))))
 
     def setFromDraft(self, draft_id):
         with open_db() as db:
             msg = db.find_message(draft_id)
-            with open(msg.get_filename(), 'rb') as fp:
-                pymessage = email.message_from_binary_file(fp, policy=email.policy.default)
+            # self.msg is modified when saving or sending, don't alter the cached message
+            pymessage = copy.deepcopy(MESSAGE_CACHE.get_message(msg.get_filename()))
 
         self.msg = pymessage
         self.draft_id = draft_id
@@ -108,9 +108,10 @@ class FoldersModel(BasicTreeModel):
             qidx = parent_qidx.child(row, 0)
 
         folder = qidx.data(self.FolderObjectRole)
-        for msg_path in paths:
-            root.move_message(msg_path, folder)
-            self.messageMoved.emit()
+        result = root.move_messages((msg_path, folder) for msg_path in paths)
+        if result.failed:
+            LOGGER.error('failed to move %d messages to %r', len(result.failed), folder.path)
+        self.messageMoved.emit()
 
         return True
 
@@ -0,0 +1,167 @@
+# this project is licensed under the WTFPLv2, see COPYING.wtfpl for details
+
+from concurrent.futures import ThreadPoolExecutor
+from logging import getLogger
+
+from PyQt5.QtCore import QObject, Qt, pyqtSignal as Signal, pyqtSlot as Slot
+
+from lierre.mailutils.message_cache import MESSAGE_CACHE
+from lierre.mailutils.plain_html import plain_to_html
+
+
+LOGGER = getLogger(__name__)
+
+
+class RenderedMessage:
+    """Result of rendering a message body, ready to be set in a widget
+
+    `body` is HTML if `is_html`, else plain text. It is None if the message
+    has no body of the requested format.
+    """
+
+    __slots__ = ('pymessage', 'display_format', 'body', 'is_html', 'attachments')
+
+    def __init__(self, pymessage, display_format):
+        self.pymessage = pymessage
+        self.display_format = display_format
+        self.body = None
+        self.is_html = False
+        # names of attachments, in the order of iter_attachments()
+        self.attachments = []
+
+
+class RenderCancelled(Exception):
+    pass
+
+
+def render_body(filename, pymessage, display_format):
+    """Return (body, is_html) of message in display_format
+
+    body is None if the message has no body of the requested format.
+    """
+
+    if display_format == 'plain':
+        body = pymessage.get_body(('plain',))
+        if body is None:
+            return None, True
+        return plain_to_html(body.get_content()), True
+    elif display_format == 'html':
+        body = pymessage.get_body(('html',))
+        if body is None:
+            return None, True
+        return body.get_content(), True
+    elif display_format == 'html_source':
+        body = pymessage.get_body(('html',))
+        if body is None:
+            return None, False
+        return body.get_content(), False
+    elif display_format == 'source':
+        with open(filename, 'rb') as fp:
+            body = fp.read()
+
+        try:
+            return body.decode('utf-8'), False
+        except UnicodeError:
+            return body.decode('iso8859-1'), False
+    else:
+        assert False
+
+
+def render_message(filename, display_format, job=None):
+    """Parse message file and render its body, both are cached
+
+    Runs in worker threads: must not touch widgets nor the db. If `job` is
+    cancelled, stops between steps by raising RenderCancelled.
+    """
+
+    pymessage = MESSAGE_CACHE.get_message(filename)
+    if job is not None and job.cancelled:
+        raise RenderCancelled()
+
+    ret = RenderedMessage(pymessage, display_format)
+    ret.attachments = [
+        attachment.get_filename() or 'untitled.attachment'
+        for attachment in pymessage.iter_attachments()
+    ]
+    ret.body, ret.is_html = MESSAGE_CACHE.get_body(
+        filename, display_format,
+        lambda: render_body(filename, pymessage, display_format),
+    )
+    return ret
+
+
+class RenderJob:
+    """Pending rendering of a message, see MessageRenderer.render"""
+
+    def __init__(self, callback):
+        self.callback = callback
+        self.cancelled = False
+
+    def cancel(self):
+        # may be called several times, e.g. on collapse then on destruction
+        self.cancelled = True
+        self.callback = None
+
+
+class MessageRenderer(QObject):
+    """Parse and render message bodies in worker threads
+
+    Opening a thread with big messages must not freeze the GUI. Widgets
+    request a rendering and get the RenderedMessage in a callback, in the GUI
+    thread, unless they cancelled the job meanwhile.
+    """
+
+    WORKERS = 2
+
+    def __init__(self, *args, **kwargs):
+        super(MessageRenderer, self).__init__(*args, **kwargs)
+        self.pool = ThreadPoolExecutor(max_workers=self.WORKERS)
+        self.closing = False
+
+        self._rendered.connect(self._deliver, Qt.QueuedConnection)
+
+    def render(self, filename, display_format, callback):
+        """Render message in a worker, call `callback(RenderedMessage)` when done
+
+        `callback` is called with None if rendering failed.
+        Returns a RenderJob that can be cancelled.
+        """
+
+        job = RenderJob(callback)
+        if not self.closing:
+            self.pool.submit(self._render, job, filename, display_format)
+        return job
+
+    def _render(self, job, filename, display_format):
+        # runs in a worker thread
+        if job.cancelled or self.closing:
+            return
+
+        try:
+            result = render_message(filename, display_format, job)
+        except RenderCancelled:
+            return
+        except Exception:
+            LOGGER.exception('failed to render %r', filename)
+            result = None
+
+        self._rendered.emit(job, result)
+
+    @Slot(object, object)
+    def _deliver(self, job, result):
+        if job.cancelled:
+            return
+
+        callback = job.callback
+        job.cancel()
+        callback(result)
+
+    @Slot()
+    def shutdown(self):
+        self.closing = True
+        self.pool.shutdown(wait=False)
+
+    _rendered = Signal(object, object)
+
+
+MESSAGE_RENDERER = MessageRenderer()
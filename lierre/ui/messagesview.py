@@ -1,26 +1,21 @@
 # this project is licensed under the WTFPLv2, see COPYING.wtfpl for details
 
-import email
-import email.policy
-import html
 from pathlib import Path
-import re
 
 from PyQt5.QtWidgets import (
     QWidget, QVBoxLayout, QFrame, QLabel, QMenu, QSizePolicy, QFileDialog,
+    QWIDGETSIZE_MAX,
 )
-from PyQt5.QtGui import QIcon, QPainter, QFontMetrics
+from PyQt5.QtGui import QIcon, QPainter
 from PyQt5.QtCore import (
     pyqtSignal as Signal, pyqtSlot as Slot, Qt, QSize, QTimer, QStandardPaths,
 )
-from lierre.mailutils.parsequote import Parser, Line, Block
-from lierre.utils.db_ops import (
-    EXCERPT_BUILDER, open_db, open_db_rw, get_thread_by_id,
-)
+from lierre.utils.db_ops import open_db_rw
 from lierre.utils.date import short_datetime
 from lierre.change_watcher import WATCHER
 
-from .models import build_thread_tree, tag_to_colors
+from .message_renderer import MESSAGE_RENDERER
+from .tag_chips import TAG_CHIPS
 from .ui_loader import load_ui_class
 
 
@@ -28,17 +23,6 @@ PlainMessageUi_Frame = load_ui_class('plain_message', 'Ui_Frame')
 CollapsedMessageUi_Frame = load_ui_class('collapsed_message', 'Ui_Frame')
 
 
-def flatten_depth_first(tree_dict):
-    def _build(msg):
-        for sub in tree_dict.get(msg, ()):
-            ret.append(sub)
-            _build(sub)
-
-    ret = []
-    _build(None)
-    return ret
-
-
 class PlainMessageWidget(QFrame, PlainMessageUi_Frame):
     UNREAD_DELAY = 5000
 
@@ -54,28 +38,30 @@ class PlainMessageWidget(QFrame, PlainMessageUi_Frame):
         tool_menu.addAction(self.actionChooseSource)
         self.toolButton.setMenu(tool_menu)
 
-        self.message_id = message.get_message_id()
-        self.message_filename = message.get_filename()
-        self.fromLabel.setText(message.get_header('From'))
-        self.toLabel.setText(message.get_header('To'))
-        self.dateLabel.setText(short_datetime(message.get_date()))
+        self.message_id = message.id
+        self.message_filename = message.filename
+        self.fromLabel.setText(message.sender)
+        self.toLabel.setText(message.to)
+        self.dateLabel.setText(short_datetime(message.date))
 
-        self.resumeDraftButton.setVisible('draft' in set(message.get_tags()))
+        self.resumeDraftButton.setVisible('draft' in message.tags)
         self.resumeDraftButton.clicked.connect(self.resumeDraft)
 
         idx = self.layout().indexOf(self.messageEdit)
-        self.tags_widget = TagsLabelWidget(list(message.get_tags()), parent=self)
+        # tags list is kept up to date by thread snapshot
+        self.tags_widget = TagsLabelWidget(message.tags, parent=self)
         self.layout().insertWidget(idx, self.tags_widget)
 
-        with open(self.message_filename, 'rb') as fp:
-            self.pymessage = email.message_from_binary_file(fp, policy=email.policy.default)
+        # parsed and rendered in a worker, see _populate_body
+        self.pymessage = None
+        self.render_job = None
+        self.attachmentsButton.setVisible(False)
 
         self.display_format = 'plain'
         self._populate_body()
-        self._populate_attachments()
 
         self.unread_timer = None
-        if 'unread' in set(message.get_tags()):
+        if 'unread' in message.tags:
             self.unread_timer = QTimer()
             self.unread_timer.setSingleShot(True)
             self.unread_timer.timeout.connect(self._mark_read)
@@ -90,140 +76,47 @@ class PlainMessageWidget(QFrame, PlainMessageUi_Frame):
         self.actionChooseHTML.triggered.connect(self._chooseFormat)
         self.actionChooseHTMLSource.triggered.connect(self._chooseFormat)
 
-        WATCHER.tagMailAdded.connect(self._addedTag, Qt.QueuedConnection)
-        WATCHER.tagMailRemoved.connect(self._removedTag, Qt.QueuedConnection)
-
     def _populate_body(self):
-        if self.display_format == 'plain':
-            self._populate_body_plain()
-        elif self.display_format == 'html':
-            self._populate_body_html()
-        elif self.display_format == 'source':
-            self._populate_body_source()
-        elif self.display_format == 'html_source':
-            self._populate_body_html_source()
-        else:
-            assert False
+        self.cancelRendering()
+        self.messageEdit.setPlainText(self.tr('Loading...'))
 
-    def _populate_body_source(self):
-        with open(self.message_filename, 'rb') as fp:
-            body = fp.read()
-
-        try:
-            body = body.decode('utf-8')
-        except UnicodeError:
-            body = body.decode('iso8859-1')
-
-        self.messageEdit.setMessage(self.pymessage)
-        self.messageEdit.setPlainText(body)
-
-    def _populate_body_html_source(self):
-        body = self.pymessage.get_body(('html',))
-        if body is None:
+        job = self.render_job = MESSAGE_RENDERER.render(
+            self.message_filename, self.display_format, self._rendered,
+        )
+        # the widget may be deleted without being told, e.g. when closing the tab
+        self.destroyed.connect(job.cancel)
+
+    def cancelRendering(self):
+        if self.render_job:
+            self.render_job.cancel()
+            self.render_job = None
+
+    def _rendered(self, result):
+        self.render_job = None
+        if result is None:
+            self.messageEdit.setPlainText(self.tr('This message could not be displayed.'))
             return
 
-        body = body.get_content()
-        self.messageEdit.setMessage(self.pymessage)
-        self.messageEdit.setPlainText(body)
-
-    def _populate_body_html(self):
-        body = self.pymessage.get_body(('html',))
-        if body is None:
-            return
+        if self.pymessage is None:
+            self._populate_attachments(result.attachments)
+        self.pymessage = result.pymessage
 
-        body = body.get_content()
         self.messageEdit.setMessage(self.pymessage)
-        self.messageEdit.setHtml(body)
-
-    def _line_to_html(self, line):
-        line_html = html.escape(line)
-
-        def to_nbsp(mtc):
-            return '&nbsp;' * len(mtc.group())
-
-        line_html = re.sub(r'\s{2,}', to_nbsp, line_html)
-
-        def to_link(mtc):
-            html_url = mtc.group()
-            url = html.unescape(html_url)
-            return '<a href="{0}">{0}</a>'.format(url)
-
-        line_html = LINK_RE.sub(to_link, line_html)
-
-        # TODO handle multiline (can't be done in this function)
-        return line_html
-
-    def _populate_body_plain(self):
-        body = self.pymessage.get_body(('plain',))
-        if body is None:
-            return
-
-        body = body.get_content()
-
-        parser = Parser()
-        parsed = parser.parse(body)
-
-        full_html = []
-
-        def _populate_rec_webengine(item):
-            if isinstance(item, Line):
-                full_html.append('  ' * item.level)
-                full_html.append(self._line_to_html(item.text))
-                full_html.append('<br/>')
-            else:
-                assert isinstance(item, Block)
-
-                if item.level:
-                    full_html.append('<blockquote>\n')
-                    full_html.append('<details open="open">\n')
-                    full_html.append('<summary>Quote</summary>\n')
-
-                for sub in item.content:
-                    _populate_rec_webengine(sub)
-
-                if item.level:
-                    full_html.append('</details>\n')
-                    full_html.append('</blockquote>\n')
-
-        def _populate_rec_qtextbrowser(item):
-            if isinstance(item, Line):
-                full_html.append('  ' * item.level)
-                full_html.append(self._line_to_html(item.text))
-                full_html.append('<br/>')
-            else:
-                assert isinstance(item, Block)
-
-                if item.level:
-                    full_html.append('</p>\n')
-                    full_html.append('<blockquote>\n')
-                    full_html.append('<p>\n')
-
-                for sub in item.content:
-                    _populate_rec_qtextbrowser(sub)
-
-                if item.level:
-                    full_html.append('</p>\n')
-                    full_html.append('</blockquote>\n')
-                    full_html.append('<p>\n')
-
-        full_html.append('<p>\n')
-        for item in parsed:
-            _populate_rec_qtextbrowser(item)
-        full_html.append('</p>\n')
-
-        self.messageEdit.setHtml(''.join(full_html))
-
-    def _populate_attachments(self):
-        has_attach = False
+        if result.body is None:
+            self.messageEdit.setPlainText('')
+        elif result.is_html:
+            self.messageEdit.setHtml(result.body)
+        else:
+            self.messageEdit.setPlainText(result.body)
 
+    def _populate_attachments(self, names):
         self.attachmentsButton.setMenu(QMenu(self.attachmentsButton))
-        for n, attachment in enumerate(self.pymessage.iter_attachments()):
-            has_attach = True
-            action = self.attachmentsButton.menu().addAction(attachment.get_filename() or 'untitled.attachment')
+        for n, name in enumerate(names):
+            action = self.attachmentsButton.menu().addAction(name)
             action.triggered.connect(self._saveAttachment)
             action.setData(n)
 
-        self.attachmentsButton.setVisible(has_attach)
+        self.attachmentsButton.setVisible(bool(names))
 
     @Slot()
     def _saveAttachment(self):
@@ -263,7 +156,8 @@ class PlainMessageWidget(QFrame, PlainMessageUi_Frame):
     def paintEvent(self, ev):
         super(PlainMessageWidget, self).paintEvent(ev)
 
-        if self.unread_timer and not self.unread_timer.isActive():
+        # only start counting once the body is displayed
+        if self.unread_timer and self.pymessage and not self.unread_timer.isActive():
             self.unread_timer.start(self.UNREAD_DELAY)
 
     @Slot()
@@ -275,124 +169,260 @@ class PlainMessageWidget(QFrame, PlainMessageUi_Frame):
             self.message_filename = msg.get_filename()
             WATCHER.tagMailRemoved.emit('unread', self.message_id)
 
-    @Slot(str, str)
-    def _addedTag(self, tag, msg_id):
-        if self.message_id == msg_id:
-            self.tags_widget.tags.append(tag)
-            self.tags_widget.update()
-
-    @Slot(str, str)
-    def _removedTag(self, tag, msg_id):
-        if self.message_id == msg_id:
-            try:
-                self.tags_widget.tags.remove(tag)
-            except ValueError:  # tag wasn't present
-                pass
-            else:
-                self.tags_widget.update()
+    def refreshTags(self):
+        self.tags_widget.updateGeometry()
+        self.tags_widget.update()
 
 
 class CollapsedMessageWidget(QFrame, CollapsedMessageUi_Frame):
     def __init__(self, message, *args, **kwargs):
         super(CollapsedMessageWidget, self).__init__(*args, **kwargs)
         self.setupUi(self)
+        self.setMessage(message)
 
-        EXCERPT_BUILDER.builtExcerpt.connect(self._builtExcerpt)
+    def setMessage(self, message):
+        # widgets are reused for other messages, reset everything
+        self.message_id = message.id
+        self.fromLabel.setText(message.sender)
+        self.toLabel.setText(message.to)
+        self.dateLabel.setText(short_datetime(message.date))
+        self.setExcerpt(message.excerpt)
 
-        self.message_id = message.get_message_id()
-        self.fromLabel.setText(message.get_header('From'))
-        self.toLabel.setText(message.get_header('To'))
-        self.dateLabel.setText(short_datetime(message.get_date()))
-        self.excerptLabel.setText(EXCERPT_BUILDER.getOrBuild(message.get_message_id()) or '')
-
-        tags = set(message.get_tags())
+        tags = set(message.tags)
         if 'unread' in tags:
             self.unreadLabel.setPixmap(QIcon.fromTheme('mail-unread').pixmap(16, 16))
+        else:
+            self.unreadLabel.clear()
         if 'attachment' in tags:
             self.attachmentLabel.setPixmap(QIcon.fromTheme('mail-attachment').pixmap(16, 16))
+        else:
+            self.attachmentLabel.clear()
 
     def mousePressEvent(self, ev):
         self.toggle.emit()
 
     toggle = Signal()
 
-    @Slot(str, str)
-    def _builtExcerpt(self, message_id, text):
-        if message_id == self.message_id:
-            self.excerptLabel.setText(text)
+    def setExcerpt(self, text):
+        self.excerptLabel.setText(text or '')
 
 
 class MessagesView(QWidget):
+    """Messages of a thread, one below the other
+
+    Threads can have hundreds of messages, so message widgets are only created
+    near the visible part of the view. Other messages are empty slots with the
+    last known (or estimated) height of their widget, so scrolling is stable.
+    """
+
+    # how far from the visible part widgets are created, in viewport heights
+    NEAR_MARGIN = 1
+    # how far from the visible part widgets are released, in viewport heights
+    FAR_MARGIN = 3
+
+    COLLAPSED_HEIGHT = 50
+    EXPANDED_HEIGHT = 400
+
+    # collapsed widgets kept for reuse
+    MAX_SPARE = 16
+
     def __init__(self, *args, **kwargs):
         super(MessagesView, self).__init__(*args, **kwargs)
         self.setLayout(QVBoxLayout())
 
+        self.snapshot = None
+        # empty widget containing the widget of each message, in thread order
+        self.slots = {}
+        # widgets of the messages near the visible part
         self.widgets = {}
+        self.spare = []
+
+        # state of messages, must survive widgets being released
+        self.expanded_ids = set()
+        self.selected_ids = set()
+        # {(message id, expanded): height}
+        self.heights = {}
+        self.collapsed_height = self.COLLAPSED_HEIGHT
 
-    def setThread(self, thread_id):
-        with open_db() as db:
-            thread = get_thread_by_id(db, thread_id)
-            tree = build_thread_tree(thread)
-            message_list = flatten_depth_first(tree)
+        self.visible_timer = QTimer(self)
+        self.visible_timer.setSingleShot(True)
+        self.visible_timer.setInterval(0)
+        self.visible_timer.timeout.connect(self._updateVisible)
 
-            self.setWindowTitle(self.tr('Thread: %s') % thread.get_subject())
+    def setThread(self, snapshot):
+        self.snapshot = snapshot
+        snapshot.tagsChanged.connect(self._tagsChanged)
+        snapshot.excerptChanged.connect(self._excerptChanged)
 
-            subjectLabel = QLabel()
-            subjectLabel.setTextFormat(Qt.PlainText)
-            subjectLabel.setText(self.tr('Subject: %s') % thread.get_subject())
-            subjectLabel.setLineWidth(1)
-            subjectLabel.setFrameShape(QFrame.Box)
-            self.layout().addWidget(subjectLabel)
+        self.setWindowTitle(self.tr('Thread: %s') % snapshot.subject)
 
-            self.buildUi(message_list)
+        subjectLabel = QLabel()
+        subjectLabel.setTextFormat(Qt.PlainText)
+        subjectLabel.setText(self.tr('Subject: %s') % snapshot.subject)
+        subjectLabel.setLineWidth(1)
+        subjectLabel.setFrameShape(QFrame.Box)
+        self.layout().addWidget(subjectLabel)
+
+        self.buildUi(list(snapshot.messages.values()))
 
     def buildUi(self, message_list):
         for msg in message_list:
-            if 'unread' in set(msg.get_tags()) or msg is message_list[-1]:
-                qmsg = PlainMessageWidget(msg, parent=self)
-                qmsg.resumeDraft.connect(self._resumeDraft)
-            else:
-                qmsg = CollapsedMessageWidget(msg, parent=self)
+            if 'unread' in msg.tags or msg is message_list[-1]:
+                self.expanded_ids.add(msg.id)
+
+            slot = QWidget(self)
+            slot.setLayout(QVBoxLayout())
+            slot.layout().setContentsMargins(0, 0, 0, 0)
+            slot.setFixedHeight(self._estimateHeight(msg.id))
+            self.layout().addWidget(slot)
+            self.slots[msg.id] = slot
+        self.layout().addStretch()
+
+        self.visible_timer.start()
+
+    def _estimateHeight(self, message_id):
+        expanded = message_id in self.expanded_ids
+        try:
+            return self.heights[message_id, expanded]
+        except KeyError:
+            return self.EXPANDED_HEIGHT if expanded else self.collapsed_height
+
+    def _createWidget(self, message_id):
+        message = self.snapshot.messages[message_id]
+        slot = self.slots[message_id]
 
+        if message_id in self.expanded_ids:
+            qmsg = PlainMessageWidget(message, parent=slot)
+            qmsg.resumeDraft.connect(self._resumeDraft)
             qmsg.toggle.connect(self._toggleMessage)
-            self.layout().addWidget(qmsg)
-            self.widgets[msg.get_message_id()] = qmsg
-        self.layout().addStretch()
+        elif self.spare:
+            qmsg = self.spare.pop()
+            qmsg.setMessage(message)
+        else:
+            qmsg = CollapsedMessageWidget(message, parent=slot)
+            qmsg.toggle.connect(self._toggleMessage)
+            self._learnCollapsedHeight(qmsg.sizeHint().height())
+
+        qmsg.setLineWidth(2 if message_id in self.selected_ids else 1)
+
+        slot.setMinimumHeight(0)
+        slot.setMaximumHeight(QWIDGETSIZE_MAX)
+        slot.layout().addWidget(qmsg)
+        qmsg.show()
+        self.widgets[message_id] = qmsg
+        return qmsg
+
+    def _learnCollapsedHeight(self, height):
+        if height == self.collapsed_height:
+            return
+
+        self.collapsed_height = height
+        # fix estimated slots so the scroll range doesn't change while scrolling
+        for message_id, slot in self.slots.items():
+            if message_id in self.widgets or message_id in self.expanded_ids:
+                continue
+            if (message_id, False) not in self.heights:
+                slot.setFixedHeight(height)
+
+    def _releaseWidget(self, message_id):
+        qmsg = self.widgets.pop(message_id)
+        slot = self.slots[message_id]
+
+        height = slot.height()
+        self.heights[message_id, message_id in self.expanded_ids] = height
+
+        slot.layout().removeWidget(qmsg)
+        if isinstance(qmsg, PlainMessageWidget):
+            qmsg.cancelRendering()
+        if isinstance(qmsg, CollapsedMessageWidget) and len(self.spare) < self.MAX_SPARE:
+            qmsg.hide()
+            self.spare.append(qmsg)
+        else:
+            qmsg.deleteLater()
+
+        slot.setFixedHeight(height)
 
     @Slot()
-    def _toggleMessage(self):
-        qmsg = self.sender()
-        self._toggleMessageWidget(qmsg)
+    def _updateVisible(self):
+        viewport = self.parentWidget()
+        if viewport is None or not self.isVisible():
+            return
 
-    def _toggleMessageWidget(self, qmsg):
-        with open_db() as db:
-            message = db.find_message(qmsg.message_id)
+        # we are moved up in the viewport of the scroll area when scrolling
+        top = -self.y()
+        height = viewport.height()
+        bottom = top + height
 
-            collapsed = isinstance(qmsg, PlainMessageWidget)
+        near_top = top - height * self.NEAR_MARGIN
+        near_bottom = bottom + height * self.NEAR_MARGIN
+        far_top = top - height * self.FAR_MARGIN
+        far_bottom = bottom + height * self.FAR_MARGIN
 
-            if collapsed:
-                new = CollapsedMessageWidget(message, parent=self)
-                # new.toggle.connect(self._selectInTree)
-            else:
-                new = PlainMessageWidget(message, parent=self)
-                new.resumeDraft.connect(self._resumeDraft)
-            new.toggle.connect(self._toggleMessage)
-            new.setLineWidth(qmsg.lineWidth())
-            self.widgets[message.get_message_id()] = new
+        for message_id, slot in self.slots.items():
+            slot_top = slot.y()
+            slot_bottom = slot_top + slot.height()
 
-            self.layout().replaceWidget(qmsg, new)
-            qmsg.deleteLater()
+            if message_id in self.widgets:
+                if slot_bottom < far_top or slot_top > far_bottom:
+                    self._releaseWidget(message_id)
+            elif slot_bottom >= near_top and slot_top <= near_bottom:
+                self._createWidget(message_id)
 
-            if not collapsed:
-                self.expanded.emit(message.get_message_id())
+    def moveEvent(self, ev):
+        # the scroll area moves us when scrolling
+        super(MessagesView, self).moveEvent(ev)
+        self.visible_timer.start()
 
-            return new
+    def resizeEvent(self, ev):
+        super(MessagesView, self).resizeEvent(ev)
+        self.visible_timer.start()
+
+    def showEvent(self, ev):
+        super(MessagesView, self).showEvent(ev)
+        self.visible_timer.start()
+
+    @Slot(list)
+    def _tagsChanged(self, message_ids):
+        for message_id in message_ids:
+            qmsg = self.widgets.get(message_id)
+            if isinstance(qmsg, PlainMessageWidget):
+                qmsg.refreshTags()
 
     @Slot(str)
-    def showMessage(self, message_id):
-        qmsg = self.widgets[message_id]
+    def _excerptChanged(self, message_id):
+        qmsg = self.widgets.get(message_id)
         if isinstance(qmsg, CollapsedMessageWidget):
-            self._toggleMessageWidget(qmsg)
+            qmsg.setExcerpt(self.snapshot.messages[message_id].excerpt)
+
+    @Slot()
+    def _toggleMessage(self):
+        qmsg = self.sender()
+        self._setExpanded(qmsg.message_id, isinstance(qmsg, CollapsedMessageWidget))
+
+    def _setExpanded(self, message_id, expanded):
+        if expanded == (message_id in self.expanded_ids):
+            return
+
+        if message_id in self.widgets:
+            self._releaseWidget(message_id)
+            self._setExpandedState(message_id, expanded)
+            self._createWidget(message_id)
+        else:
+            self._setExpandedState(message_id, expanded)
+            self.slots[message_id].setFixedHeight(self._estimateHeight(message_id))
+
+        if expanded:
+            self.expanded.emit(message_id)
+
+    def _setExpandedState(self, message_id, expanded):
+        if expanded:
+            self.expanded_ids.add(message_id)
+        else:
+            self.expanded_ids.discard(message_id)
+
+    @Slot(str)
+    def showMessage(self, message_id):
+        self._setExpanded(message_id, True)
         # TODO scroll into view
 
     @Slot(list)
@@ -400,16 +430,20 @@ class MessagesView(QWidget):
         if not added:
             return
 
-        qmsg = self.widgets[added[-1]]
-        self.parent().parent().ensureWidgetVisible(qmsg)
+        # the slot always exists, the message widget will be created once visible
+        slot = self.slots[added[-1]]
+        self.parent().parent().ensureWidgetVisible(slot)
 
     @Slot(list, list)
     def selectMessageChanged(self, added, removed):
         def changeWidth(l, width):
             for message_id in l:
-                qmsg = self.widgets[message_id]
-                qmsg.setLineWidth(width)
+                qmsg = self.widgets.get(message_id)
+                if qmsg is not None:
+                    qmsg.setLineWidth(width)
 
+        self.selected_ids.difference_update(removed)
+        self.selected_ids.update(added)
         changeWidth(removed, 1)
         changeWidth(added, 2)
 
@@ -423,7 +457,6 @@ class MessagesView(QWidget):
 
 
 class TagsLabelWidget(QFrame):
-    xpadding = 2
     xmargin = 5
     ymargin = 0
 
@@ -433,13 +466,6 @@ class TagsLabelWidget(QFrame):
 
         self.setSizePolicy(QSizePolicy(QSizePolicy.Minimum, QSizePolicy.Minimum, QSizePolicy.Label))
 
-    def _positions(self, tags):
-        fm = QFontMetrics(self.font())
-
-        for tag in tags:
-            sz = fm.size(Qt.TextSingleLine, tag)
-            yield sz, tag
-
     def paintEvent(self, ev):
         super(TagsLabelWidget, self).paintEvent(ev)
 
@@ -452,35 +478,14 @@ class TagsLabelWidget(QFrame):
 
             painter.setClipRect(ev.rect())
 
-            fm = QFontMetrics(self.font())  # TODO use style
-
-            x = self.xmargin
-            for sz, tag in self._positions(self.tags):
-                fg, bg = tag_to_colors(tag)
-                painter.setPen(fg.color())
-
-                painter.fillRect(x, self.ymargin, sz.width() + 2 * self.xpadding, fm.height(), bg.color())
-                painter.drawText(x + self.xpadding, self.ymargin + fm.ascent(), tag)
-                x += sz.width() + self.xmargin + 2 * self.xpadding
-
+            TAG_CHIPS.paint(painter, self.xmargin, self.ymargin, self.tags, self.font(), self.xmargin)
         finally:
             painter.restore()
 
     def sizeHint(self):
-        fm = QFontMetrics(self.font())
+        fm = TAG_CHIPS.fontMetrics(self.font())
 
-        x = self.xmargin
-        y = 0
-        for sz, tag in self._positions(self.tags):
-            x += sz.width() + self.xmargin + 2 * self.xpadding
-            y = self.ymargin * 2 + fm.height()
+        x = self.xmargin + TAG_CHIPS.totalWidth(self.tags, self.font(), self.xmargin)
+        y = self.ymargin * 2 + fm.height() if self.tags else 0
 
         return QSize(x, y)
-
-
-LINK_RE = re.compile(
-    r'''https?://
-    [][(),'!*$_a-z@.A-Z:0-9/~;?+&=%#-]+  # legal chars in a URL
-    [a-zA-Z0-9/+=#]+  # but we prefer URLs end with those rather than one of the above chars
-    ''', re.VERBOSE,
-)
@@ -1,21 +1,27 @@
 # this project is licensed under the WTFPLv2, see COPYING.wtfpl for details
 
 from copy import deepcopy
+from functools import lru_cache
 from hashlib import sha1
+import heapq
+from itertools import islice
 import json
 import logging
 from enum import IntFlag, auto as enum_auto
 import re
+import sys
 
 from PyQt5.QtCore import (
     QModelIndex, QVariant, QAbstractItemModel, Qt, QMimeData, pyqtSlot as Slot,
 )
 from PyQt5.QtGui import QBrush, QColor
+from notmuch import NotmuchError
 from lierre.config import CONFIG
 from lierre.utils.date import short_datetime
 from lierre.utils.addresses import get_sender
+from lierre.utils.tag_stats import TAG_STATS
 from lierre.utils.db_ops import (
-    iter_thread_messages, get_thread_by_id, EXCERPT_BUILDER, open_db_rw,
+    iter_thread_messages, get_thread_by_id, open_db_rw,
     open_db,
 )
 from lierre.change_watcher import WATCHER, diff_sorted
@@ -33,33 +39,6 @@ def register_role():
     return LAST_ROLE
 
 
-def build_thread_tree(thread):
-    def _build(msg):
-        it = msg.get_replies()
-        for sub in it:
-            ret.setdefault(msg, []).append(sub)
-            _build(sub)
-
-    ret = {}
-
-    for msg in thread.get_toplevel_messages():
-        ret.setdefault(None, []).append(msg)
-        _build(msg)
-
-    return ret
-
-
-def flatten_depth_first(tree_dict):
-    def _build(msg):
-        for sub in tree_dict.get(msg, ()):
-            ret.append(sub)
-            _build(sub)
-
-    ret = []
-    _build(None)
-    return ret
-
-
 class BasicTreeModel(QAbstractItemModel):
     def __init__(self, *args, **kwargs):
         super(BasicTreeModel, self).__init__(*args, **kwargs)
@@ -67,6 +46,8 @@ class BasicTreeModel(QAbstractItemModel):
         self.objs = {}
         self.tree = {None: []}
         self.parents = {}
+        # row of each item in the children of its parent
+        self.rows = {}
 
     # QAbstractItemModel
     def index(self, row, col, parent_qidx=QModelIndex()):
@@ -86,9 +67,7 @@ class BasicTreeModel(QAbstractItemModel):
         if parent is None:
             return QModelIndex()
 
-        gparent = self.parents[parent]
-        row = self.tree[gparent].index(parent)
-        return self.createIndex(row, 0, self.objs[parent])
+        return self._keyToIndex(parent)
 
     def flags(self, qidx):
         obj = qidx.internalPointer()
@@ -129,15 +108,20 @@ class BasicTreeModel(QAbstractItemModel):
     def _to_key(self, obj):
         return obj['key'] if obj else None
 
+    def _keyToIndex(self, key, col=0):
+        return self.createIndex(self.rows[key], col, self.objs[key])
+
     def _setTree(self, tree, objs):
         self.modelAboutToBeReset.emit()
 
         self.objs = objs
         self.tree = tree
         self.parents = {}
+        self.rows = {}
         for msg in self.tree:
-            for sub in self.tree[msg]:
+            for row, sub in enumerate(self.tree[msg]):
                 self.parents[sub] = msg
+                self.rows[sub] = row
 
         self.modelReset.emit()
 
@@ -150,8 +134,7 @@ class BasicListModel(QAbstractItemModel):
 
     # QAbstractItemModel
     def index(self, row, col, parent_qidx=QModelIndex()):
-        parent = parent_qidx.internalPointer()
-        if parent:
+        if parent_qidx.isValid():
             return QModelIndex()
 
         if row >= len(self.objs) or col >= len(self.columns):
@@ -163,17 +146,13 @@ class BasicListModel(QAbstractItemModel):
         return QModelIndex()
 
     def flags(self, qidx):
-        obj = qidx.internalPointer()
-        if obj is None:
+        if not qidx.isValid():
             return Qt.NoItemFlags
         else:
             return Qt.ItemIsSelectable | Qt.ItemIsEnabled
 
     def rowCount(self, qidx=QModelIndex()):
-        if qidx.column() != 0 and qidx.isValid():
-            return 0
-        item = qidx.internalPointer()
-        if item:
+        if qidx.isValid():
             return 0
         else:
             return len(self.objs)
@@ -191,8 +170,7 @@ class BasicListModel(QAbstractItemModel):
         return self.columns[section][0]
 
     def hasChildren(self, qidx=QModelIndex()):
-        item = qidx.internalPointer()
-        return not item
+        return not qidx.isValid()
 
     def canFetchMore(self, qidx):
         return False
@@ -213,31 +191,57 @@ class BasicListModel(QAbstractItemModel):
         old_keys = [self._sort_key(d) for d in self.objs]
         new_keys = [self._sort_key(d) for d in new_objs]
 
+        # group consecutive rows inserted, removed or kept: [kind, start, count]
+        # when applying runs in order, rows before a run are already like
+        # in new_objs, so the run starts at its position in new_objs
+        runs = []
         n = 0
         for old, new in diff_sorted(old_keys, new_keys):
             if old is None:
-                self.beginInsertRows(QModelIndex(), n, n)
-                self.objs.insert(n, new_objs[n])
-                self.endInsertRows()
-                n += 1
+                kind = 'insert'
             elif new is None:
-                self.beginRemoveRows(QModelIndex(), n, n)
-                del self.objs[n]
-                self.endRemoveRows()
+                kind = 'remove'
             else:
                 assert old == new
-                # warning: letting self.objs[n] to another object will lead
-                # to crashes as a view can keep an old QModelIndex with an
-                # old dict that we would be freeing right now.
-                # thus we need to mutate the existing dict
-                self.objs[n].clear()
-                self.objs[n].update(new_objs[n])
-
-                qidx1 = self.index(n, 0)
-                qidx2 = qidx1.siblingAtColumn(self.columnCount() - 1)
-                self.dataChanged.emit(qidx1, qidx2, [])
+                kind = 'keep'
+
+            if runs and runs[-1][0] == kind:
+                runs[-1][2] += 1
+            else:
+                runs.append([kind, n, 1])
+
+            if new is not None:
                 n += 1
 
+        for kind, start, count in runs:
+            end = start + count
+            if kind == 'insert':
+                self.beginInsertRows(QModelIndex(), start, end - 1)
+                self.objs[start:start] = new_objs[start:end]
+                self.endInsertRows()
+            elif kind == 'remove':
+                self.beginRemoveRows(QModelIndex(), start, end - 1)
+                del self.objs[start:end]
+                self.endRemoveRows()
+            else:
+                self._replaceObjs(start, new_objs[start:end])
+
+    def _replaceObjs(self, start, objs):
+        # warning: letting self.objs[row] to another object will lead
+        # to crashes as a view can keep an old QModelIndex with an
+        # old dict that we would be freeing right now.
+        # thus we need to mutate the existing dict
+        for row, obj in enumerate(objs, start):
+            self.objs[row].clear()
+            self.objs[row].update(obj)
+
+        self._emitRowsChanged(start, start + len(objs) - 1)
+
+    def _emitRowsChanged(self, first, last):
+        qidx1 = self.index(first, 0)
+        qidx2 = self.index(last, self.columnCount() - 1)
+        self.dataChanged.emit(qidx1, qidx2, [])
+
 
 class MaildirFlags(IntFlag):
     Unread = enum_auto()
@@ -273,58 +277,37 @@ class ThreadMessagesModel(BasicTreeModel):
         ('Date', 'date'),
     )
 
-    def __init__(self, thread_id, *args, **kwargs):
+    def __init__(self, snapshot, *args, **kwargs):
         super(ThreadMessagesModel, self).__init__(*args, **kwargs)
 
-        EXCERPT_BUILDER.builtExcerpt.connect(self._builtExcerpt)
-
-        with open_db() as db:
-            thread = get_thread_by_id(db, thread_id)
-            tree = build_thread_tree(thread)
-
-            objs = {
-                obj.get_message_id(): self._dict_from_obj(obj)
-                for obj in flatten_depth_first(tree)
-            }
-
-            tree = {
-                msg.get_message_id() if msg else None: [sub.get_message_id() for sub in tree[msg]]
-                for msg in tree
-            }
-
-        self._setTree(tree, objs)
-        # if building the tree here and it's built somewhere else too -> crash
-        # self.tree = build_thread_tree(thread)
-
-    def _dict_from_obj(self, msg):
-        excerpt = EXCERPT_BUILDER.getOrBuild(msg.get_message_id())
+        self.snapshot = snapshot
+        snapshot.tagsChanged.connect(self._tagsChanged)
+        snapshot.excerptChanged.connect(self._excerptChanged)
 
-        return {
-            'filename': msg.get_filename(),
-            'key': msg.get_message_id(),
-            'sender': msg.get_header('From'),
-            'date': msg.get_date(),
-            'excerpt': excerpt,
-            'tags': list(msg.get_tags()),
+        objs = {
+            msg_id: {'key': msg_id, 'message': message}
+            for msg_id, message in snapshot.messages.items()
         }
+        self._setTree(snapshot.tree, objs)
 
     def data(self, qidx, role=Qt.DisplayRole):
         item = qidx.internalPointer()
         if item is None:
             return QVariant()
+        message = item['message']
 
         if role == self.MessageIdRole:
-            return QVariant(item['key'])
+            return QVariant(message.id)
         elif role == self.MessageFilenameRole:
-            return QVariant(item['filename'])
+            return QVariant(message.filename)
         elif role == self.MessageObjectRole:
             raise NotImplementedError()
             return QVariant(item)
         elif role == self.MessageFlagsRole:
-            return QVariant(MaildirFlags.tags_to_flags(item['tags']))
+            return QVariant(MaildirFlags.tags_to_flags(message.tags))
         elif role == Qt.DisplayRole:
             name = self.columns[qidx.column()][1]
-            data = item[name]
+            data = getattr(message, name)
             if name == 'sender':
                 data = get_sender(data)
             elif name == 'date':
@@ -333,26 +316,26 @@ class ThreadMessagesModel(BasicTreeModel):
 
         return QVariant()
 
-    @Slot(str, str)
-    def _builtExcerpt(self, msg_id, text):
-        self.objs[msg_id]['excerpt'] = text
+    @Slot(list)
+    def _tagsChanged(self, msg_ids):
+        for msg_id in msg_ids:
+            qidx1 = self._keyToIndex(msg_id)
+            qidx2 = qidx1.siblingAtColumn(self.columnCount() - 1)
+            self.dataChanged.emit(qidx1, qidx2, [])
 
-        parent = self.parents[msg_id]
-        row = self.tree[parent].index(msg_id)
-
-        qidx = self.createIndex(row, 2, self.objs[msg_id])
+    @Slot(str)
+    def _excerptChanged(self, msg_id):
+        qidx = self._keyToIndex(msg_id, 2)
         self.dataChanged.emit(qidx, qidx)
 
     def _itemToIndex(self, key):
-        parent = self.parents[key]
-        row = self.tree[parent].index(key)
-        return self.createIndex(row, 0, self.objs[key])
+        return self._keyToIndex(key)
 
     def findById(self, msg_id):
         return self._itemToIndex(msg_id)
 
 
-def tag_to_colors(tag):
+def _compute_tag_colors(tag):
     ancestors = [tag[:match.start()] for match in re.finditer('/', tag)]
     ancestors.append(tag)
     ancestors.reverse()
@@ -373,6 +356,30 @@ def tag_to_colors(tag):
     return QBrush(_fg_from_bg_color(bg)), QBrush(bg)
 
 
+class TagColorsCache:
+    MAX_SIZE = 1024
+
+    def __init__(self):
+        # copy of the config section the cached colors were computed with
+        self.config = {}
+        self.colors = lru_cache(maxsize=self.MAX_SIZE)(_compute_tag_colors)
+
+    def get(self, tag):
+        config = CONFIG.get('ui', 'tag_colors', default={})
+        if config != self.config:
+            self.config = dict(config)
+            self.colors.cache_clear()
+        return self.colors(tag)
+
+
+TAG_COLORS = TagColorsCache()
+
+
+def tag_to_colors(tag):
+    """Return (foreground, background) QBrush of tag, they must not be modified"""
+    return TAG_COLORS.get(tag)
+
+
 def _fg_from_bg_color(qcolor):
     if qcolor.red() + qcolor.green() + qcolor.blue() < 128 * 3:
         return QColor('white')
@@ -391,22 +398,23 @@ class TagsListModel(BasicListModel):
 
     def __init__(self, db, *args, **kwargs):
         super(TagsListModel, self).__init__(*args, **kwargs)
-        objs = self._build_objs(db)
+        TAG_STATS.ensureBuilt(db)
+        objs = self._build_objs()
         self._setObjs(objs)
 
-        WATCHER.globalRefresh.connect(self.refresh, Qt.QueuedConnection)
-        WATCHER.tagMailAdded.connect(self.refresh, Qt.QueuedConnection)
-        WATCHER.tagMailRemoved.connect(self.refresh, Qt.QueuedConnection)
+        TAG_STATS.changed.connect(self.refresh)
 
-    def _build_objs(self, db):
-        return [
-            {
+    def _build_objs(self):
+        objs = []
+        for tag, counts in sorted(TAG_STATS.counts.items()):
+            # counts are None until TAG_STATS is built
+            unread, total = counts or (None, None)
+            objs.append({
                 'name': tag,
-                'unread': db.create_query('tag:%s AND tag:unread' % tag).count_messages(),
-                'total': db.create_query('tag:%s' % tag).count_messages(),
-            }
-            for tag in db.get_all_tags()
-        ]
+                'unread': unread,
+                'total': total,
+            })
+        return objs
 
     def supportedDropActions(self):
         return Qt.LinkAction
@@ -418,6 +426,9 @@ class TagsListModel(BasicListModel):
         return QVariant(item.get('display_name') or item['name'])
 
     def _get_unread_text(self, item):
+        if item['total'] is None:
+            # not counted yet
+            return QVariant('')
         return QVariant(f'{item["unread"]}/{item["total"]}')
 
     def data(self, qidx, role=Qt.DisplayRole):
@@ -477,8 +488,7 @@ class TagsListModel(BasicListModel):
 
     @Slot()
     def refresh(self):
-        with open_db() as db:
-            new_objs = self._build_objs(db)
+        new_objs = self._build_objs()
         self._updateObjs(new_objs)
 
     def _sort_key(self, d):
@@ -558,6 +568,30 @@ class CheckableTagsListModel(TagsListModel):
         self._updateObjs(new)
 
 
+class ThreadRow:
+    __slots__ = ('id', 'authors', 'subject', 'messages_count', 'last_update', 'tags')
+
+    def __init__(self, id, authors, subject, messages_count, last_update, tags):
+        self.id = id
+        self.authors = authors
+        self.subject = subject
+        self.messages_count = messages_count
+        self.last_update = last_update
+        # many threads share the same tags, keep a single copy of each
+        self.tags = tuple(sys.intern(tag) for tag in tags)
+
+    @classmethod
+    def from_thread(cls, thread):
+        return cls(
+            id=thread.get_thread_id(),
+            authors=thread.get_authors(),
+            subject=thread.get_subject(),
+            messages_count=thread.get_total_messages(),
+            last_update=thread.get_newest_date(),
+            tags=thread.get_tags(),
+        )
+
+
 class ThreadListModel(BasicListModel):
     ThreadIdRole = register_role()
     ThreadFlagsRole = register_role()
@@ -570,35 +604,90 @@ class ThreadListModel(BasicListModel):
         ('Last update', 'last_update'),
     )
 
+    # number of threads loaded at once, more are loaded when view scrolls
+    PAGE_SIZE = 256
+
     def __init__(self, *args, **kwargs):
         super(ThreadListModel, self).__init__(*args, **kwargs)
         self.query_text = None
         self.indexes = {}
+        # generator of the threads not loaded yet, None if all are loaded
+        self.pending = None
+        self.pending_pos = 0
+        # threads changed after pending query was started, not loaded yet
+        self.outdated = set()
         WATCHER.globalRefresh.connect(self.refresh, Qt.QueuedConnection)
         WATCHER.mailAdded.connect(self.refresh, Qt.QueuedConnection)
-        WATCHER.tagMailAdded.connect(self.refreshOneMail, Qt.QueuedConnection)
-        WATCHER.tagMailRemoved.connect(self.refreshOneMail, Qt.QueuedConnection)
+        WATCHER.threadsChanged.connect(self.refreshThreads, Qt.QueuedConnection)
+        WATCHER.tagsChanged.connect(self.refreshMails, Qt.QueuedConnection)
 
-    def setQuery(self, db, query_text):
+    def setQuery(self, query_text):
         self.query_text = query_text
-        objs = self._build_objs(db)
+        self._startPending()
+        objs = self._takePending(self.PAGE_SIZE)
         self._setObjs(objs)
         # TODO: generalise this "indexes" mechanism to other models?
-        self.indexes = {obj['id']: n for n, obj in enumerate(objs)}
-
-    def _build_objs(self, db):
-        query = db.create_query(self.query_text)
-        return [self._thread_to_dict(thread) for thread in query.search_threads()]
-
-    def _thread_to_dict(self, thread):
-        return {
-            'id': thread.get_thread_id(),
-            'authors': thread.get_authors(),
-            'subject': thread.get_subject(),
-            'messages_count': thread.get_total_messages(),
-            'last_update': thread.get_newest_date(),
-            'tags': list(thread.get_tags()),
-        }
+        self.indexes = {obj.id: n for n, obj in enumerate(objs)}
+
+    def _iter_objs(self, skip=0):
+        # the db stays open as long as the generator is not exhausted or closed
+        with open_db() as db:
+            query = db.create_query(self.query_text)
+            for thread in islice(query.search_threads(), skip, None):
+                yield ThreadRow.from_thread(thread)
+
+    def _startPending(self, skip=0):
+        self._stopPending()
+        self.pending = self._iter_objs(skip)
+        # number of threads of the query already yielded by pending
+        self.pending_pos = skip
+
+    def _stopPending(self):
+        if self.pending is not None:
+            self.pending.close()
+            self.pending = None
+        self.outdated.clear()
+
+    def _takePending(self, count):
+        if self.pending is None:
+            return []
+
+        objs = []
+        try:
+            for obj in islice(self.pending, count):
+                objs.append(obj)
+        except NotmuchError:
+            # the db snapshot of pending query may be invalidated by writes,
+            # restart it after the threads it already yielded
+            LOGGER.info('threads query was invalidated, restarting it')
+            self.pending = self._iter_objs(self.pending_pos + len(objs))
+            objs.extend(islice(self.pending, count - len(objs)))
+        self.pending_pos += len(objs)
+
+        exhausted = len(objs) < count
+        if self.outdated:
+            objs = self._refreshOutdated(objs)
+        if exhausted:
+            self._stopPending()
+        return objs
+
+    def _refreshOutdated(self, objs):
+        if not any(obj.id in self.outdated for obj in objs):
+            return objs
+
+        refreshed = []
+        with open_db() as db:
+            for obj in objs:
+                if obj.id not in self.outdated:
+                    refreshed.append(obj)
+                    continue
+
+                self.outdated.discard(obj.id)
+                thread = get_thread_by_id(db, obj.id)
+                if thread is not None:
+                    refreshed.append(ThreadRow.from_thread(thread))
+                # else the thread was removed or merged since the query
+        return refreshed
 
     def _get_messages_count(self, thread):
         return QVariant(str(()))
@@ -606,25 +695,34 @@ class ThreadListModel(BasicListModel):
     def _get_last_update(self, thread):
         return QVariant(short_datetime(()))
 
+    def index(self, row, col, parent_qidx=QModelIndex()):
+        if parent_qidx.isValid():
+            return QModelIndex()
+
+        if row >= len(self.objs) or col >= len(self.columns):
+            return QModelIndex()
+        # rows are found by number, not by pointer, so they can be replaced
+        return self.createIndex(row, col)
+
     def data(self, qidx, role=Qt.DisplayRole):
-        item = qidx.internalPointer()
-        if item is None:
+        if not qidx.isValid():
             return QVariant()
+        item = self.objs[qidx.row()]
 
         if role == self.ThreadFlagsRole:
-            return QVariant(MaildirFlags.tags_to_flags(item['tags']))
+            return QVariant(MaildirFlags.tags_to_flags(item.tags))
         elif role == self.ThreadTagsRole:
-            return QVariant(item['tags'])
+            return QVariant(item.tags)
         elif role == Qt.DisplayRole:
             name = self.columns[qidx.column()][1]
-            data = item[name]
+            data = getattr(item, name)
             if name == 'last_update':
                 data = short_datetime(data)
             elif name == 'messages_count':
                 data = str(data)
             return QVariant(data)
         elif role == self.ThreadIdRole:
-            return item['id']
+            return item.id
 
         return QVariant()
 
@@ -646,38 +744,145 @@ class ThreadListModel(BasicListModel):
         mime.setData('text/x-lierre-threads', json.dumps(ids).encode('ascii'))
         return mime
 
+    def canFetchMore(self, parent_qidx):
+        return not parent_qidx.isValid() and self.pending is not None
+
+    def fetchMore(self, parent_qidx):
+        if not self.canFetchMore(parent_qidx):
+            return
+
+        objs = self._takePending(self.PAGE_SIZE)
+        if not objs:
+            return
+
+        start = len(self.objs)
+        self.beginInsertRows(QModelIndex(), start, start + len(objs) - 1)
+        self.objs.extend(objs)
+        self.indexes.update((obj.id, n) for n, obj in enumerate(objs, start))
+        self.endInsertRows()
+
     @Slot()
     def refresh(self):
         if not self.query_text:
             return
-        with open_db() as db:
-            objs = self._build_objs(db)
+        # only refresh as many threads as were loaded
+        count = max(len(self.objs), self.PAGE_SIZE)
+        self._startPending()
+        objs = self._takePending(count)
         self._updateObjs(objs)
-        self.indexes = {obj['id']: n for n, obj in enumerate(objs)}
+        self.indexes = {obj.id: n for n, obj in enumerate(objs)}
+
+    # max number of thread ids put in a single query
+    THREADS_CHUNK = 100
+
+    def _query_threads(self, db, thread_ids):
+        for start in range(0, len(thread_ids), self.THREADS_CHUNK):
+            chunk = thread_ids[start:start + self.THREADS_CHUNK]
+            query_text = ' OR '.join(f'thread:{tid}' for tid in chunk)
+            if self.query_text.strip() != '*':
+                # notmuch only understands "*" when it's the whole query
+                query_text = f'({self.query_text}) AND ({query_text})'
+            yield from db.create_query(query_text).search_threads()
+
+    def _findRow(self, key):
+        start, end = 0, len(self.objs)
+        while start < end:
+            mid = (start + end) // 2
+            if self._sort_key(self.objs[mid]) < key:
+                start = mid + 1
+            else:
+                end = mid
+        return start
 
-    @Slot(str, str)
-    def refreshOneMail(self, _, msgid):
-        with open_db() as db:
-            query = db.create_query(f'id:{msgid}')
-            if hasattr(query, 'set_omit_excluded'):
-                # FIXME remove condition when function is integrated in notmuch bindings
-                query.set_omit_excluded(query.EXCLUDE.FALSE)
-            thread = next(iter(query.search_threads()))
-            tid = thread.get_thread_id()
+    def _staysAt(self, row, key):
+        after_previous = row == 0 or self._sort_key(self.objs[row - 1]) < key
+        if row < len(self.objs) - 1:
+            before_next = key < self._sort_key(self.objs[row + 1])
+        else:
+            # threads not loaded yet sort after the current key of the last row
+            before_next = self.pending is None or key <= self._sort_key(self.objs[row])
+        return after_previous and before_next
+
+    @Slot(list)
+    def refreshThreads(self, thread_ids):
+        """Update, insert or remove only the given threads
 
-            try:
-                row = self.indexes[tid]
-            except KeyError:
-                return
+        Loaded rows stay a prefix of the query results: a thread sorting
+        after the last loaded row is left to pending query.
+        """
 
-            new_obj = self._thread_to_dict(thread)
+        if not self.query_text:
+            return
 
-        self.objs[row].clear()
-        self.objs[row].update(new_obj)
+        with open_db() as db:
+            new_objs = {
+                thread.get_thread_id(): ThreadRow.from_thread(thread)
+                for thread in self._query_threads(db, thread_ids)
+            }
 
-        qidx1 = self.index(row, 0)
-        qidx2 = qidx1.siblingAtColumn(self.columnCount() - 1)
-        self.dataChanged.emit(qidx1, qidx2, [])
+        # rows staying at their place are replaced first, it doesn't shift rows
+        moved = set()
+        for tid in dict.fromkeys(thread_ids):
+            row = self.indexes.get(tid)
+            if row is None:
+                continue
+
+            new_obj = new_objs.get(tid)
+            if new_obj is not None and self._staysAt(row, self._sort_key(new_obj)):
+                self._replaceObjs(row, [new_obj])
+                del new_objs[tid]
+            else:
+                moved.add(tid)
+
+        kept = [obj for obj in self.objs if obj.id not in moved]
+        inserted = sorted(new_objs.values(), key=self._sort_key)
+        if self.pending is not None:
+            if kept:
+                last_key = self._sort_key(kept[-1])
+                inserted = [obj for obj in inserted if self._sort_key(obj) < last_key]
+            else:
+                inserted = []
 
-    def _sort_key(self, d):
-        return (-d['last_update'], d['id'])
+        if moved or inserted:
+            # removed and inserted rows are notified by ranges
+            self._updateObjs(list(heapq.merge(kept, inserted, key=self._sort_key)))
+            self.indexes = {obj.id: n for n, obj in enumerate(self.objs)}
+
+        if self.pending is not None:
+            # old pending query has neither the new threads nor the shifted rows
+            self._startPending(len(self.objs))
+
+    @Slot(object)
+    def refreshMails(self, changes):
+        with open_db() as db:
+            thread_ids = set()
+            for msgid in changes:
+                msg = db.find_message(msgid)
+                if msg is not None:
+                    thread_ids.add(msg.get_thread_id())
+
+            new_objs = {}
+            gone = []
+            for tid in thread_ids:
+                if tid in self.indexes:
+                    thread = get_thread_by_id(db, tid)
+                    if thread is None:
+                        # removed or merged since it was loaded
+                        gone.append(tid)
+                    else:
+                        new_objs[tid] = ThreadRow.from_thread(thread)
+                elif self.pending is not None:
+                    # pending query may yield this thread later, with old data
+                    self.outdated.add(tid)
+
+        for tid, new_obj in new_objs.items():
+            self._replaceObjs(self.indexes[tid], [new_obj])
+        if gone:
+            self.refreshThreads(gone)
+
+    def _replaceObjs(self, start, objs):
+        self.objs[start:start + len(objs)] = objs
+        self._emitRowsChanged(start, start + len(objs) - 1)
+
+    def _sort_key(self, row):
+        return (-row.last_update, row.id)
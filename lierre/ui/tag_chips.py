@@ -0,0 +1,88 @@
+# this project is licensed under the WTFPLv2, see COPYING.wtfpl for details
+
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QFontMetrics, QPainter, QPixmap
+
+from .models import tag_to_colors
+
+
+class TagChips:
+    """Tags rendered as colored chips, cached as pixmaps
+
+    Views painting tags on every row only have to blit the pixmaps, and
+    measuring tags uses cached widths.
+    """
+
+    xpadding = 2
+
+    MAX_SIZE = 2048
+
+    def __init__(self):
+        self.metrics = {}
+        self.widths = {}
+        self.pixmaps = {}
+
+    def fontMetrics(self, font):
+        key = font.key()
+        try:
+            return self.metrics[key]
+        except KeyError:
+            fm = self.metrics[key] = QFontMetrics(font)
+            return fm
+
+    def width(self, tag, font):
+        key = (tag, font.key())
+        try:
+            return self.widths[key]
+        except KeyError:
+            if len(self.widths) >= self.MAX_SIZE:
+                self.widths.clear()
+
+            width = self.fontMetrics(font).size(Qt.TextSingleLine, tag).width()
+            width = self.widths[key] = width + 2 * self.xpadding
+            return width
+
+    def totalWidth(self, tags, font, margin):
+        return sum(self.width(tag, font) + margin for tag in tags)
+
+    def pixmap(self, tag, font, ratio):
+        # colors are part of the key so chips follow color config changes
+        fg, bg = tag_to_colors(tag)
+        key = (tag, font.key(), ratio, fg.color().rgba(), bg.color().rgba())
+        try:
+            return self.pixmaps[key]
+        except KeyError:
+            pass
+
+        if len(self.pixmaps) >= self.MAX_SIZE:
+            self.pixmaps.clear()
+
+        fm = self.fontMetrics(font)
+        width = self.width(tag, font)
+
+        pixmap = QPixmap(round(width * ratio), round(fm.height() * ratio))
+        pixmap.setDevicePixelRatio(ratio)
+        pixmap.fill(bg.color())
+
+        painter = QPainter(pixmap)
+        try:
+            painter.setFont(font)
+            painter.setPen(fg.color())
+            painter.drawText(self.xpadding, fm.ascent(), tag)
+        finally:
+            painter.end()
+
+        self.pixmaps[key] = pixmap
+        return pixmap
+
+    def paint(self, painter, x, y, tags, font, margin):
+        """Draw tags chips from (x, y), return x after the last chip and its margin"""
+
+        ratio = painter.device().devicePixelRatioF()
+        for tag in tags:
+            painter.drawPixmap(x, y, self.pixmap(tag, font, ratio))
+            x += self.width(tag, font) + margin
+        return x
+
+
+TAG_CHIPS = TagChips()
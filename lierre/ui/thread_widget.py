@@ -4,7 +4,8 @@ from functools import reduce
 
 from PyQt5.QtCore import pyqtSlot as Slot, pyqtSignal as Signal
 from PyQt5.QtWidgets import QWidget, QToolBar, QMenu
-from lierre.utils.db_ops import open_db, open_db_rw, UNTOUCHABLE_TAGS, get_thread_by_id
+from lierre.utils.db_ops import open_db, open_db_rw, UNTOUCHABLE_TAGS
+from lierre.utils.thread_snapshot import ThreadSnapshot
 from lierre.change_watcher import WATCHER
 
 from .ui_loader import load_ui_class
@@ -15,35 +16,6 @@ from .tag_editor import TagEditor
 Ui_Form = load_ui_class('thread_widget', 'Ui_Form')
 
 
-def build_thread_tree(thread):
-    # TODO attach weak tree to thread?
-
-    def _build(msg):
-        it = msg.get_replies()
-        for sub in it:
-            ret.setdefault(msg, []).append(sub)
-            _build(sub)
-
-    ret = {}
-
-    for msg in thread.get_toplevel_messages():
-        ret.setdefault(None, []).append(msg)
-        _build(msg)
-
-    return ret
-
-
-def flatten_depth_first(tree_dict):
-    def _build(msg):
-        for sub in tree_dict.get(msg, ()):
-            ret.append(sub)
-            _build(sub)
-
-    ret = []
-    _build(None)
-    return ret
-
-
 class ThreadWidget(QWidget, Ui_Form):
     def __init__(self, thread_id, *args, **kwargs):
         super(ThreadWidget, self).__init__(*args, **kwargs)
@@ -53,11 +25,14 @@ class ThreadWidget(QWidget, Ui_Form):
 
         self.setupToolbar()
 
-        mdl = ThreadMessagesModel(thread_id)
+        # read once, for both the tree and the messages view
+        snapshot = ThreadSnapshot(thread_id, parent=self)
+
+        mdl = ThreadMessagesModel(snapshot)
         self.messagesTree.setModel(mdl)
         self.messagesTree.expandAll()
 
-        self.messagesView.setThread(thread_id)
+        self.messagesView.setThread(snapshot)
         self.messagesView.resumeDraft.connect(self.triggeredResumeDraft)
         self.messagesTree.messageActivated.connect(self.messagesView.showMessage)
         self.messagesTree.messagesSelectionChanged.connect(self.messagesView.selectMessageChanged)
@@ -66,9 +41,7 @@ class ThreadWidget(QWidget, Ui_Form):
 
         self.messagesView.expanded.connect(self.messagesTree.selectMessage)
 
-        with open_db() as db:
-            thread = get_thread_by_id(db, thread_id)
-            self.setWindowTitle(self.tr('Thread: %s') % thread.get_subject())
+        self.setWindowTitle(self.tr('Thread: %s') % snapshot.subject)
 
     def setupToolbar(self):
         tb = QToolBar()
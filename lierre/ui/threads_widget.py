@@ -3,15 +3,16 @@
 import logging
 
 from PyQt5.QtWidgets import QWidget, QStyledItemDelegate, QStyle, QToolBar
-from PyQt5.QtGui import QFontMetrics, QPen
+from PyQt5.QtGui import QPen
 from PyQt5.QtCore import (
     pyqtSignal as Signal, pyqtSlot as Slot, Qt, QSize,
 )
-from lierre.utils.db_ops import open_db, open_db_rw, get_thread_by_id
+from lierre.utils.db_ops import open_db, open_db_rw, get_thread_by_id, iter_thread_messages
 from lierre.config import CONFIG
 from lierre.change_watcher import WATCHER
 
-from .models import ThreadListModel, TagsListModel, MaildirFlags, tag_to_colors
+from .models import ThreadListModel, TagsListModel, MaildirFlags
+from .tag_chips import TAG_CHIPS
 from .tag_editor import TagEditor
 from .ui_loader import load_ui_class
 
@@ -35,13 +36,6 @@ class ThreadSubjectDelegate(ThreadUnreadDelegate):
     xmargin = 5
     ymargin = 0
 
-    def _positions(self, option, tags):
-        fm = QFontMetrics(option.font)
-
-        for tag in tags:
-            sz = fm.size(Qt.TextSingleLine, tag)
-            yield sz, tag
-
     def paint(self, painter, option, qidx):
         self.initStyleOption(option, qidx)
 
@@ -59,16 +53,9 @@ class ThreadSubjectDelegate(ThreadUnreadDelegate):
             painter.translate(option.rect.topLeft())
             painter.setFont(option.font)
 
-            fm = QFontMetrics(option.font)
+            fm = TAG_CHIPS.fontMetrics(option.font)
 
-            x = self.xmargin
-            for sz, tag in self._positions(option, tags):
-                fg, bg = tag_to_colors(tag)
-                painter.setPen(fg.color())
-
-                painter.fillRect(x, self.ymargin, sz.width() + 2 * self.xpadding, fm.height(), bg.color())
-                painter.drawText(x + self.xpadding, self.ymargin + fm.ascent(), tag)
-                x += sz.width() + self.xmargin + 2 * self.xpadding
+            x = TAG_CHIPS.paint(painter, self.xmargin, self.ymargin, tags, option.font, self.xmargin)
 
             if option.state & QStyle.State_Selected:
                 painter.setPen(QPen(option.palette.highlightedText(), 1))
@@ -81,28 +68,16 @@ class ThreadSubjectDelegate(ThreadUnreadDelegate):
     def sizeHint(self, option, qidx):
         tags = qidx.sibling(qidx.row(), 0).data(qidx.model().ThreadTagsRole)
 
-        fm = QFontMetrics(option.font)
+        fm = TAG_CHIPS.fontMetrics(option.font)
 
-        x = self.xmargin
-        y = 0
-        for sz, tag in self._positions(option, tags):
-            x += sz.width() + self.xmargin + 2 * self.xpadding
-            y = self.ymargin * 2 + fm.height()
+        x = self.xmargin + TAG_CHIPS.totalWidth(tags, option.font, self.xmargin)
+        y = self.ymargin * 2 + fm.height() if tags else 0
 
         x += fm.size(Qt.TextSingleLine, qidx.data()).width()
 
         return QSize(x, y)
 
 
-def iter_thread_messages(thread):
-    def recurse_list(it):
-        for msg in it:
-            yield msg
-            yield from recurse_list(msg.get_replies())
-
-    yield from recurse_list(thread.get_toplevel_messages())
-
-
 class ThreadsWidget(QWidget, Ui_Form):
     def __init__(self, *args, **kwargs):
         super(ThreadsWidget, self).__init__(*args, **kwargs)
@@ -159,8 +134,7 @@ class ThreadsWidget(QWidget, Ui_Form):
     @Slot()
     def doSearch(self):
         query_text = self.searchLine.text()
-        with open_db() as db:
-            self.threadsView.model().setQuery(db, query_text)
+        self.threadsView.model().setQuery(query_text)
         self.setWindowTitle(self.tr('Query: %s') % query_text)
 
     def setQueryAndSearch(self, text):
@@ -3,7 +3,7 @@
 import os.path
 import sys
 
-from PyQt5.QtWidgets import QMainWindow, QProgressBar
+from PyQt5.QtWidgets import QMainWindow, QProgressBar, QToolButton
 from PyQt5.QtGui import QIcon
 from PyQt5.QtCore import pyqtSlot as Slot
 import xdg.BaseDirectory as xbd
@@ -36,6 +36,12 @@ class Window(Ui_MainWindow, QMainWindow):
 
         self.fetchProgress = QProgressBar()
         self.statusbar.addPermanentWidget(self.fetchProgress)
+        self.cancelFetch = QToolButton()
+        self.cancelFetch.setIcon(QIcon.fromTheme('process-stop'))
+        self.cancelFetch.setToolTip(self.tr('Cancel fetching'))
+        self.cancelFetch.clicked.connect(self._cancelRefresh)
+        self.cancelFetch.hide()
+        self.statusbar.addPermanentWidget(self.cancelFetch)
         self.statusbar.addPermanentWidget(ErrorIndicator())
 
         self.setWindowIcon(get_icon('lierre'))
@@ -49,17 +55,36 @@ class Window(Ui_MainWindow, QMainWindow):
     def _startRefresh(self):
         self.fetcher = Fetcher()
         self.fetcher.finished.connect(self._finishedRefresh)
+        self.fetcher.progress.connect(self._fetchProgress)
 
         self.fetchProgress.show()
         self.fetchProgress.setRange(0, 0)
+        self.cancelFetch.setEnabled(True)
+        self.cancelFetch.show()
         self.actionRefresh.setEnabled(False)
 
         self.fetcher.start()
 
+    @Slot(int)
+    def _fetchProgress(self, value):
+        if value < 0:
+            # busy indicator
+            self.fetchProgress.setRange(0, 0)
+        else:
+            self.fetchProgress.setRange(0, 100)
+            self.fetchProgress.setValue(value)
+
+    @Slot()
+    def _cancelRefresh(self):
+        # remaining jobs are dropped, the current one stops if it can
+        self.fetcher.cancel()
+        self.cancelFetch.setEnabled(False)
+
     @Slot()
     def _finishedRefresh(self):
         self.actionRefresh.setEnabled(True)
         self.fetchProgress.hide()
+        self.cancelFetch.hide()
         self.fetcher = None
 
     @Slot()
@@ -1,23 +1,22 @@
 # this project is licensed under the WTFPLv2, see COPYING.wtfpl for details
 
-from configparser import ConfigParser
-from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
-import email
-import email.policy
 import gc
-import re
+from logging import getLogger
+import os
+import time
 
 import notmuch
 from PyQt5.QtCore import (
-    QObject, QBasicTimer, pyqtSignal as Signal
+    QObject, QBasicTimer, Qt, pyqtSignal as Signal, pyqtSlot as Slot,
 )
-from lierre.config import get_notmuch_config_path
-try:
-    from html2text import HTML2Text
-    HAS_HTML2TEXT = True
-except ImportError:
-    HAS_HTML2TEXT = False
+from lierre.change_watcher import WATCHER
+from lierre.config import get_notmuch_excluded_tags
+from lierre.mailutils.excerpt import get_excerpt
+
+
+LOGGER = getLogger(__name__)
 
 
 def get_thread_by_id(db, id):
@@ -42,41 +41,121 @@ def iter_thread_messages(thread):
 
 
 class Database(notmuch.Database):
-    @staticmethod
-    def _get_excluded_tags():
-        try:
-            with open(get_notmuch_config_path()) as fd:
-                cfg = ConfigParser(interpolation=None)
-                cfg.read_file(fd)
-                return list(filter(None, cfg.get('search', 'exclude_tags', fallback='').split(';')))
-        except OSError:
-            return []
-
     def create_query(self, querystring):
         query = super(Database, self).create_query(querystring)
 
-        for tag in self._get_excluded_tags():
+        for tag in get_notmuch_excluded_tags():
             query.exclude_tag(tag)
 
         return query
 
 
+class ReadOnlyHandle:
+    """Read-only database kept open across open_db() calls
+
+    An open handle does not see newer revisions, so it is reopened when the
+    database was written by us or by another process.
+    Must only be used from the GUI thread.
+    """
+
+    def __init__(self):
+        self.db = None
+        self.stamp = None
+        self.stale = False
+        self.xapian_path = None
+        self.revision = None
+
+        self.opened = 0
+        self.reused = 0
+
+    def _get_stamp(self):
+        if self.xapian_path is None:
+            return None
+
+        # xapian renames its version file when committing
+        try:
+            return os.stat(self.xapian_path).st_mtime_ns
+        except OSError:
+            return None
+
+    def get(self):
+        stamp = self._get_stamp()
+        if self.db is not None and not self.stale and stamp is not None and stamp == self.stamp:
+            self.reused += 1
+            return self.db
+
+        self.release()
+
+        self.db = Database(mode=notmuch.Database.MODE.READ_ONLY)
+        self.stale = False
+        if self.xapian_path is None:
+            self.xapian_path = os.path.join(self.db.get_path(), '.notmuch', 'xapian')
+            stamp = self._get_stamp()
+        # stamp was taken before opening: a concurrent commit will only cause a useless reopen
+        self.stamp = stamp
+        self.revision = self.db.get_revision()[0]
+        self.opened += 1
+        LOGGER.debug(
+            'opened read-only db at revision %d (opened %d times, reused %d times)',
+            self.revision, self.opened, self.reused
+        )
+        return self.db
+
+    def invalidate(self):
+        self.stale = True
+
+    def release(self):
+        if self.db is None:
+            return
+
+        # WTF: collecting now makes python to free Thread then Threads.
+        # Omitting it can cause python to free Threads then Thread (segfault!)
+        # This happens more when build_thread_tree is used.
+        # Garbage cycles referencing db objects must be freed while the db
+        # is still alive, before dropping our reference to it.
+        gc.collect()
+        self.db = None
+
+
+READ_HANDLE = ReadOnlyHandle()
+
+# filter jobs hold the write lock for short chunks, wait for them to release it
+LOCK_TIMEOUT = 5
+LOCK_INTERVAL = .05
+
+
 @contextmanager
 def open_db():
+    yield READ_HANDLE.get()
+
+
+def _open_rw():
+    end = time.monotonic() + LOCK_TIMEOUT
+    while True:
+        try:
+            return Database(mode=notmuch.Database.MODE.READ_WRITE)
+        except notmuch.XapianError:
+            # "Unable to get write lock", another thread or process is writing
+            if time.monotonic() >= end:
+                raise
+            time.sleep(LOCK_INTERVAL)
+
+
+@contextmanager
+def open_db_rw():
     try:
-        with Database(mode=notmuch.Database.MODE.READ_ONLY) as db:
+        with _open_rw() as db:
             yield db
     finally:
-        # WTF: collecting now makes python to free Thread then Threads.
-        # Omitting it can cause python to free Threads then Thread (segfault!)
-        # This happens more when build_thread_tree is used.
         gc.collect()
+        READ_HANDLE.invalidate()
 
 
 @contextmanager
-def open_db_rw():
+def open_private_db():
+    """Read-only database for other threads, which can't use open_db"""
     try:
-        with Database(mode=notmuch.Database.MODE.READ_WRITE) as db:
+        with Database(mode=notmuch.Database.MODE.READ_ONLY) as db:
             yield db
     finally:
         gc.collect()
@@ -89,80 +168,157 @@ def get_db_path():
 class ExcerptBuilder(QObject):
     PROPERTY = 'x-lierre-excerpt'
 
+    # parsing is done in worker threads
+    WORKERS = 2
+    # built excerpts are gathered during this delay and stored at once
+    STORE_DELAY = 200
+    # delay before storing again if the db could not be opened
+    RETRY_DELAY = 5000
+    # prefetching stops when that many mails are being built
+    PREFETCH_LIMIT = 500
+
     def __init__(self, *args, **kwargs):
         super(ExcerptBuilder, self).__init__(*args, **kwargs)
-        self.queue = deque()
+        self.pool = ThreadPoolExecutor(max_workers=self.WORKERS)
+        self.closing = False
+        self.building = set()
+        self.built = {}
         self.timer = QBasicTimer()
 
-    def getOrBuild(self, message_id):
+        self._parsedExcerpt.connect(self._storeLater, Qt.QueuedConnection)
+        # new mails from a fetch will probably be viewed soon
+        WATCHER.messagesChanged.connect(self._prefetchMessages, Qt.QueuedConnection)
+
+    def getOrBuildMany(self, message_ids):
         with open_db() as db:
-            message = db.find_message(message_id)
-            filename = message.get_filename()
-            value = message.get_property(self.PROPERTY)
-            if value is not None:
-                return value
+            return self._getOrQueue(self._findMessages(db, message_ids))
 
-        self._queueMail((message_id, filename))
+    def getOrBuildThread(self, thread_id):
+        with open_db() as db:
+            thread = get_thread_by_id(db, thread_id)
+            if thread is None:
+                return {}
+            return self._getOrQueue(iter_thread_messages(thread))
 
-    def _queueMail(self, item):
-        self.queue.append(item)
-        if not self.timer.isActive():
-            self.timer.start(0, self)
+    def getOrBuildMessages(self, messages):
+        # for callers already having the notmuch messages
+        return self._getOrQueue(messages)
 
-    def _getExcerptPlainText(self, pymessage):
-        body = pymessage.get_body(('plain',))
+    def prefetchQuery(self, query_text):
+        # e.g. after "notmuch new", so excerpts are ready when opening threads
+        with open_db() as db:
+            return self._prefetch(db.create_query(query_text).search_messages())
 
-        if body is not None:
-            text = body.get_content()
-            text = re.sub(r'^>.*$', '', text, flags=re.MULTILINE)
-            return text
+    @Slot(list)
+    def _prefetchMessages(self, message_ids):
+        with open_db() as db:
+            self._prefetch(self._findMessages(db, message_ids))
 
-    def _getExcerptHtml(self, pymessage):
-        body = pymessage.get_body(('html',))
+    def _findMessages(self, db, message_ids):
+        for message_id in message_ids:
+            message = db.find_message(message_id)
+            # messages may have been removed since their ids were sent
+            if message is not None:
+                yield message
+
+    def _prefetch(self, messages):
+        # a big fetch or import would queue all its mails: stop at
+        # PREFETCH_LIMIT mails being built, the others are built when viewed
+        queued = 0
+        for message in messages:
+            if len(self.building) >= self.PREFETCH_LIMIT:
+                break
+            if message.get_property(self.PROPERTY) is None:
+                queued += self._queueMails([(message.get_message_id(), message.get_filename())])
+        return queued
+
+    def _getOrQueue(self, messages):
+        excerpts = {}
+        missing = []
+        for message in messages:
+            message_id = message.get_message_id()
+            excerpt = message.get_property(self.PROPERTY)
+            if excerpt is None:
+                # built but not stored yet
+                excerpt = self.built.get(message_id)
+            excerpts[message_id] = excerpt
+            if excerpt is None:
+                missing.append((message_id, message.get_filename()))
+
+        self._queueMails(missing)
+        return excerpts
+
+    def _queueMails(self, items):
+        if not hasattr(notmuch.Message, 'add_property'):
+            # FIXME remove condition when function is integrated in notmuch bindings
+            return 0
+
+        queued = 0
+        for message_id, filename in items:
+            if message_id in self.building or message_id in self.built or self.closing:
+                continue
+
+            self.building.add(message_id)
+            self.pool.submit(self._build, message_id, filename)
+            queued += 1
+        return queued
+
+    def _build(self, message_id, filename):
+        # runs in a worker thread, must not touch the db
+        text = None
+        if not self.closing:
+            try:
+                with open(filename, 'rb') as fp:
+                    text = get_excerpt(fp)
+            except Exception:
+                LOGGER.exception('failed to build excerpt of %r', message_id)
+
+        self._parsedExcerpt.emit(message_id, text)
+
+    @Slot(str, object)
+    def _storeLater(self, message_id, text):
+        self.building.discard(message_id)
+        if text is None:
+            return
 
-        if body is not None:
-            text = body.get_content()
-            converter = HTML2Text()
-            converter.skip_internal_links = True
-            converter.unicode_snob = True
-            converter.ignore_tables = True
-            converter.ignore_images = True
-            return converter.handle(text)
+        self.built[message_id] = text
+        if not self.timer.isActive():
+            self.timer.start(self.STORE_DELAY, self)
 
     def timerEvent(self, ev):
         if ev.timerId() != self.timer.timerId():
             super(ExcerptBuilder, self).timerEvent(ev)
             return
 
-        message_id, filename = self.queue.popleft()
+        self.timer.stop()
 
-        if not self.queue:
-            self.timer.stop()
-
-        if not hasattr(notmuch.Message, 'add_property'):
-            # FIXME remove condition when function is integrated in notmuch bindings
+        built, self.built = self.built, {}
+        try:
+            with open_db_rw() as db:
+                db.begin_atomic()
+                for message_id, text in built.items():
+                    message = db.find_message(message_id)
+                    if message is not None:
+                        message.add_property(self.PROPERTY, text)
+                db.end_atomic()
+        except notmuch.NotmuchError as exc:
+            # e.g. db is locked by a filter job, keep them for later
+            LOGGER.warning('could not store %d excerpts, will retry: %s', len(built), exc)
+            built.update(self.built)
+            self.built = built
+            self.timer.start(self.RETRY_DELAY, self)
             return
 
-        with open(filename, 'rb') as fp:
-            pymessage = email.message_from_binary_file(fp, policy=email.policy.default)
-
-        text = self._getExcerptPlainText(pymessage)
-        if text is None:
-            if HAS_HTML2TEXT:
-                text = self._getExcerptHtml(pymessage)
-            else:
-                return
-        if not text:
-            text = ''
-
-        text = re.sub(r'\s+', ' ', text)
-        text = text[:100]
-
-        with open_db_rw() as db:
-            message = db.find_message(message_id)
-            message.add_property(self.PROPERTY, text)
+        for message_id, text in built.items():
             self.builtExcerpt.emit(message_id, text)
 
+    @Slot()
+    def shutdown(self):
+        # don't wait for queued mails when quitting
+        self.closing = True
+        self.pool.shutdown(wait=False)
+
+    _parsedExcerpt = Signal(str, object)
     builtExcerpt = Signal(str, str)
 
 
@@ -3,14 +3,17 @@
 from base64 import b64encode, b64decode
 from collections import namedtuple
 import email.policy
+import errno
 from logging import getLogger
 from os import getpid
 from pathlib import Path
 import re
 import shutil
 from socket import gethostname
-from time import time
-from typing import Union, Optional, Iterable
+from time import monotonic, time
+from typing import Union, Optional, Iterable, Tuple, Callable
+
+from lierre.change_watcher import WATCHER
 
 from .db_ops import get_db_path, open_db_rw
 
@@ -85,27 +88,130 @@ class Folder(namedtuple('Folder', ('path', 'parts'))):
         return self.parts[-1]
 
 
-def change_flags(src_path: StrOrPath, to_add: Optional[Tags] = None, to_remove: Optional[Tags] = None):
-    src_path = Path(src_path)
-    if ':2,' not in src_path.name:
-        raise NotImplementedError()
+# maildir flags notmuch synchronizes with tags:
+# {flag: (tag, whether the flag means the tag is set)}
+SYNCED_FLAGS = {
+    'D': ('draft', True),
+    'F': ('flagged', True),
+    'P': ('passed', True),
+    'R': ('replied', True),
+    'S': ('unread', False),
+}
 
-    to_add = set(to_add or [])
-    to_remove = set(to_remove or [])
-    src_path = Path(src_path)
 
-    name, sep, s_flags = src_path.name.rpartition(':2,')
-    flags = set(s_flags)
-    flags |= to_add
-    flags -= to_remove
+class FlagsResult(namedtuple('FlagsResult', ('renamed', 'failed', 'elapsed'))):
+    """Result of change_flags_many
+
+    `renamed` is a list of (old path, new path), `failed` is a list of
+    (path, exception), `elapsed` is in seconds.
+    """
 
-    dest_path = src_path.with_name('%s%s%s' % (name, sep, ''.join(flags)))
-    src_path.rename(dest_path)
+    @property
+    def rate(self):
+        # files per second
+        return len(self.renamed) / self.elapsed if self.elapsed else 0.
+
+
+def change_flags_many(changes: Iterable[Tuple[StrOrPath, Optional[Tags], Optional[Tags]]], db=None) -> FlagsResult:
+    """Change maildir flags of many files in one database session
+
+    `changes` are (path, flags to add, flags to remove). If `db` is None, a
+    read-write database is opened.
+
+    If only flags synchronized with tags change, tags are changed and notmuch
+    renames the files itself. Else files are renamed here and notmuch updates
+    the tags from the new flags.
+    """
+
+    changes = list(changes)
+    if db is None:
+        with open_db_rw() as db:
+            return change_flags_many(changes, db)
+
+    start = monotonic()
+    renamed = []
+    failed = []
+
+    db.begin_atomic()
+    try:
+        for src_path, to_add, to_remove in changes:
+            src_path = Path(src_path)
+            to_remove = set(to_remove or [])
+            to_add = set(to_add or []) - to_remove
+
+            try:
+                new_path = _change_file_flags(db, src_path, to_add, to_remove)
+            except (OSError, NotImplementedError) as exc:
+                LOGGER.warning('failed to change flags of %r: %r', src_path, exc)
+                failed.append((src_path, exc))
+            else:
+                renamed.append((src_path, new_path))
+    finally:
+        db.end_atomic()
+
+    result = FlagsResult(renamed, failed, monotonic() - start)
+    LOGGER.info(
+        'changed flags of %d files in %.3fs (%.0f files/s), %d failed',
+        len(renamed), result.elapsed, result.rate, len(failed),
+    )
+    return result
+
+
+def _change_file_flags(db, src_path: Path, to_add: set, to_remove: set) -> Path:
+    name, sep, s_flags = src_path.name.rpartition(':2,')
+    if not sep:
+        raise NotImplementedError('no maildir flags in %r' % src_path.name)
+
+    msg = db.find_message_by_filename(str(src_path))
+    old_tags = set(msg.get_tags()) if msg is not None else set()
+
+    if msg is not None and (to_add | to_remove) <= SYNCED_FLAGS.keys():
+        msg.freeze()
+        for flag in to_add | to_remove:
+            tag, flag_sets_tag = SYNCED_FLAGS[flag]
+            if (flag in to_add) == flag_sets_tag:
+                msg.add_tag(tag)
+            else:
+                msg.remove_tag(tag)
+        msg.thaw()
+        msg.tags_to_maildir_flags()
+
+        dest_path = src_path
+        for path in map(Path, msg.get_filenames()):
+            if path.parent == src_path.parent and path.name.rpartition(':2,')[0] == name:
+                dest_path = path
+                break
+    else:
+        flags = (set(s_flags) | to_add) - to_remove
+
+        # maildir flags must be in ASCII order
+        dest_path = src_path.with_name('%s%s%s' % (name, sep, ''.join(sorted(flags))))
+        src_path.rename(dest_path)
 
-    with open_db_rw() as db:
         db.add_message(str(dest_path))
         db.remove_message(str(src_path))
 
+        msg = db.find_message_by_filename(str(dest_path))
+        if msg is not None:
+            msg.maildir_flags_to_tags()
+
+    if msg is not None:
+        new_tags = set(msg.get_tags())
+        for tag in new_tags - old_tags:
+            WATCHER.tagMailAdded.emit(tag, msg.get_message_id())
+        for tag in old_tags - new_tags:
+            WATCHER.tagMailRemoved.emit(tag, msg.get_message_id())
+
+    return dest_path
+
+
+class MoveResult(namedtuple('MoveResult', ('moved', 'failed'))):
+    """Result of MaildirPP.move_messages
+
+    `moved` is a list of (old path, new path), `failed` is a list of
+    (path, exception).
+    """
+
 
 class MaildirPP:
     def __init__(self, path: Optional[StrOrPath] = None):
@@ -177,7 +283,22 @@ class MaildirPP:
         msg_path = Path(msg_path)
         old_flags = self._parse_flags(msg_path.name)
 
+        # the name reserved in tmp/ guarantees the name in cur/ is unique
         tmp_uniq = self._build_uniq(folder)
+        dest_path = folder.path.joinpath('cur').joinpath(f'{tmp_uniq.name}:2,{old_flags}')
+
+        # on the same filesystem, an atomic rename avoids copying the whole message
+        try:
+            LOGGER.debug('moving %r to %r', msg_path, dest_path)
+            msg_path.rename(dest_path)
+        except OSError as exc:
+            if exc.errno != errno.EXDEV:
+                tmp_uniq.unlink()
+                raise
+        else:
+            tmp_uniq.unlink()
+            return dest_path
+
         LOGGER.debug('moving %r to %r', msg_path, tmp_uniq)
         shutil.copy(str(msg_path), str(tmp_uniq))
 
@@ -185,6 +306,48 @@ class MaildirPP:
         msg_path.unlink()
         return ret
 
+    def move_messages(
+        self, moves: Iterable[Tuple[StrOrPath, Folder]], db=None,
+        progress: Optional[Callable[[int, int], None]] = None,
+    ) -> MoveResult:
+        """Move many messages and update the index in one atomic block
+
+        `moves` are (message path, destination folder) pairs. If `db` is
+        None, a read-write database is opened. `progress(done, total)` is
+        called after each message.
+
+        A message failing to move doesn't stop the others, failures are
+        returned along with the moved messages.
+        """
+
+        moves = list(moves)
+        if db is None:
+            with open_db_rw() as db:
+                return self.move_messages(moves, db, progress)
+
+        result = MoveResult([], [])
+
+        db.begin_atomic()
+        try:
+            for done, (msg_path, folder) in enumerate(moves, 1):
+                msg_path = Path(msg_path)
+                try:
+                    new_path = self.move_message(msg_path, folder)
+                except OSError as exc:
+                    LOGGER.warning('failed to move %r to %r: %s', msg_path, folder.path, exc)
+                    result.failed.append((msg_path, exc))
+                else:
+                    db.add_message(str(new_path))
+                    db.remove_message(str(msg_path))
+                    result.moved.append((msg_path, new_path))
+
+                if progress:
+                    progress(done, len(moves))
+        finally:
+            db.end_atomic()
+
+        return result
+
     def clean_tmp(self, folder: Folder) -> None:
         now = time()
         for sub in folder.path.joinpath('tmp').iterdir():
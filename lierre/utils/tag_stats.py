@@ -0,0 +1,186 @@
+# this project is licensed under the WTFPLv2, see COPYING.wtfpl for details
+
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from logging import getLogger
+
+from PyQt5.QtCore import (
+    QObject, QBasicTimer, Qt, pyqtSignal as Signal, pyqtSlot as Slot,
+)
+from lierre.change_watcher import WATCHER
+from lierre.config import get_notmuch_excluded_tags
+
+from .db_ops import open_db, open_private_db
+
+
+LOGGER = getLogger(__name__)
+
+
+def count_message_tags(msg_tags, excluded, unread, total):
+    # like notmuch, a message having an excluded tag is not counted in a
+    # query, unless the query explicitly mentions that tag
+    hidden = msg_tags & excluded
+    is_unread = 'unread' in msg_tags
+
+    for tag in msg_tags:
+        if hidden <= {tag}:
+            total[tag] += 1
+        if is_unread and hidden <= {tag, 'unread'}:
+            unread[tag] += 1
+
+
+class TagStats(QObject):
+    def __init__(self, *args, **kwargs):
+        super(TagStats, self).__init__(*args, **kwargs)
+
+        # {tag: (unread, total)}, None until ensureBuilt
+        # (unread, total) of each tag is None until the first build is done
+        self.counts = None
+
+        self.dirty_tags = set()
+        self.dirty_msgs = set()
+        self.timer = QBasicTimer()
+
+        # all tags are counted in one pass over the messages, in a thread
+        self.pool = ThreadPoolExecutor(max_workers=1)
+        self.building = False
+        self.build_again = False
+        self.closing = False
+        self._built.connect(self._setCounts, Qt.QueuedConnection)
+
+        WATCHER.globalRefresh.connect(self._refreshAll, Qt.QueuedConnection)
+        WATCHER.tagsChanged.connect(self._tagsChanged, Qt.QueuedConnection)
+        WATCHER.messagesChanged.connect(self._messagesChanged, Qt.QueuedConnection)
+
+    def ensureBuilt(self, db):
+        if self.counts is None:
+            # tags are listed at once, their counts come later
+            self.counts = dict.fromkeys(db.get_all_tags())
+            self.rebuild()
+
+    def rebuild(self):
+        if self.building:
+            self.build_again = True
+            return
+
+        self.building = True
+        self.pool.submit(self._build, set(get_notmuch_excluded_tags()))
+
+    def _build(self, excluded):
+        # runs in a worker thread, must use its own db
+        unread = Counter()
+        total = Counter()
+        tags = set()
+
+        try:
+            with open_private_db() as db:
+                query = db.create_query('*')
+                if hasattr(query, 'set_omit_excluded'):
+                    # FIXME remove condition when function is integrated in notmuch bindings
+                    query.set_omit_excluded(query.EXCLUDE.FALSE)
+
+                for msg in query.search_messages():
+                    if self.closing:
+                        return
+                    msg_tags = set(msg.get_tags())
+                    tags |= msg_tags
+                    count_message_tags(msg_tags, excluded, unread, total)
+        except Exception:
+            LOGGER.exception('failed to count tags')
+            self._built.emit(None)
+            return
+
+        self._built.emit({tag: (unread[tag], total[tag]) for tag in tags})
+
+    @Slot(object)
+    def _setCounts(self, counts):
+        self.building = False
+        if counts is not None:
+            self.counts = counts
+            self.changed.emit()
+
+        if self.build_again:
+            self.build_again = False
+            self.rebuild()
+        elif self.dirty_tags or self.dirty_msgs:
+            # changed while building, the build may not have seen it
+            self.timer.start(0, self)
+
+    def _recount(self, db, tags):
+        all_tags = set(db.get_all_tags())
+
+        for tag in tags:
+            if tag not in all_tags:
+                self.counts.pop(tag, None)
+                continue
+
+            self.counts[tag] = (
+                db.create_query('tag:%s AND tag:unread' % tag).count_messages(),
+                db.create_query('tag:%s' % tag).count_messages(),
+            )
+
+    @Slot()
+    def _refreshAll(self):
+        if self.counts is None:
+            return
+
+        self.rebuild()
+
+    @Slot(object)
+    def _tagsChanged(self, changes):
+        if self.counts is None:
+            return
+
+        for msg_id, (added, removed) in changes.items():
+            self.dirty_tags.update(added, removed)
+            self.dirty_msgs.add(msg_id)
+        if not self.timer.isActive():
+            self.timer.start(0, self)
+
+    @Slot(list)
+    def _messagesChanged(self, msg_ids):
+        if self.counts is None:
+            return
+
+        # their old tags are unknown, only the tags they have now are
+        # recounted, messages removed from the db cause a globalRefresh
+        self.dirty_msgs.update(msg_ids)
+        if not self.timer.isActive():
+            self.timer.start(0, self)
+
+    def timerEvent(self, ev):
+        if ev.timerId() != self.timer.timerId():
+            super(TagStats, self).timerEvent(ev)
+            return
+
+        self.timer.stop()
+        if self.building:
+            # recounted when the build is done
+            return
+
+        # changing a tag can change counts of every other tag of the message
+        # (unread tag, excluded tags), recount them all but only once per burst
+        tags, self.dirty_tags = self.dirty_tags, set()
+        msg_ids, self.dirty_msgs = self.dirty_msgs, set()
+
+        with open_db() as db:
+            for msg_id in msg_ids:
+                msg = db.find_message(msg_id)
+                if msg is not None:
+                    tags.update(msg.get_tags())
+
+            LOGGER.debug('recounting %d tags', len(tags))
+            self._recount(db, tags)
+
+        self.changed.emit()
+
+    @Slot()
+    def shutdown(self):
+        self.closing = True
+        self.pool.shutdown(wait=False)
+
+    _built = Signal(object)
+    changed = Signal()
+
+
+TAG_STATS = TagStats()
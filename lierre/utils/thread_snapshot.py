@@ -0,0 +1,110 @@
+# this project is licensed under the WTFPLv2, see COPYING.wtfpl for details
+
+from PyQt5.QtCore import (
+    QObject, Qt, pyqtSignal as Signal, pyqtSlot as Slot,
+)
+from lierre.change_watcher import WATCHER
+
+from .db_ops import EXCERPT_BUILDER, open_db, get_thread_by_id
+
+
+class MessageInfo:
+    __slots__ = ('id', 'parent', 'filename', 'sender', 'to', 'date', 'tags', 'excerpt')
+
+    def __init__(self, msg, parent, excerpt):
+        self.id = msg.get_message_id()
+        self.parent = parent
+        self.filename = msg.get_filename()
+        self.sender = msg.get_header('From')
+        self.to = msg.get_header('To')
+        self.date = msg.get_date()
+        self.tags = list(msg.get_tags())
+        self.excerpt = excerpt
+
+
+def iter_depth_first(thread):
+    """Yield (message, parent message id) of thread, replies after their parent"""
+
+    stack = [(msg, None) for msg in reversed(list(thread.get_toplevel_messages()))]
+    while stack:
+        msg, parent = stack.pop()
+        yield msg, parent
+
+        msg_id = msg.get_message_id()
+        stack.extend((sub, msg_id) for sub in reversed(list(msg.get_replies())))
+
+
+class ThreadSnapshot(QObject):
+    """Messages of a thread read once from db, shared by the views of the thread
+
+    Tags and excerpts of messages are kept up to date, views are notified
+    by tagsChanged and excerptChanged.
+    """
+
+    def __init__(self, thread_id, *args, **kwargs):
+        super(ThreadSnapshot, self).__init__(*args, **kwargs)
+
+        self.thread_id = thread_id
+        # {id: MessageInfo}, in depth-first order
+        self.messages = {}
+        # {parent id: [children ids]}, parent id is None for top-level messages
+        self.tree = {None: []}
+
+        with open_db() as db:
+            thread = get_thread_by_id(db, thread_id)
+            if thread is None:
+                # its messages were removed since the thread was listed,
+                # let the lists drop it
+                self.subject = ''
+                found = []
+                WATCHER.threadsChanged.emit([thread_id])
+            else:
+                self.subject = thread.get_subject()
+                found = list(iter_depth_first(thread))
+
+            excerpts = EXCERPT_BUILDER.getOrBuildMessages(msg for msg, _ in found)
+
+            for msg, parent in found:
+                info = MessageInfo(msg, parent, excerpts[msg.get_message_id()])
+                self.messages[info.id] = info
+                self.tree.setdefault(parent, []).append(info.id)
+
+        WATCHER.tagsChanged.connect(self._tagsChanged, Qt.QueuedConnection)
+        EXCERPT_BUILDER.builtExcerpt.connect(self._builtExcerpt)
+
+    @Slot(object)
+    def _tagsChanged(self, changes):
+        changed = []
+        for msg_id, (added, removed) in changes.items():
+            info = self.messages.get(msg_id)
+            if info is None:
+                continue
+
+            # mutate the list, widgets may display it
+            info.tags[:] = [tag for tag in info.tags if tag not in removed]
+            info.tags.extend(sorted(added.difference(info.tags)))
+            changed.append(msg_id)
+
+        if not changed:
+            return
+
+        # syncing maildir flags with tags renames files
+        with open_db() as db:
+            for msg_id in changed:
+                msg = db.find_message(msg_id)
+                if msg is not None:
+                    self.messages[msg_id].filename = msg.get_filename()
+
+        self.tagsChanged.emit(changed)
+
+    @Slot(str, str)
+    def _builtExcerpt(self, msg_id, text):
+        info = self.messages.get(msg_id)
+        if info is None:
+            return
+
+        info.excerpt = text
+        self.excerptChanged.emit(msg_id)
+
+    tagsChanged = Signal(list)
+    excerptChanged = Signal(str)
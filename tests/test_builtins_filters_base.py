@@ -0,0 +1,71 @@
+# this project is licensed under the WTFPLv2, see COPYING.wtfpl for details
+
+import threading
+import time
+
+from PyQt5.QtCore import QCoreApplication
+from lierre.builtins.filters.base import ThreadedJob
+
+
+class CountingJob(ThreadedJob):
+    def __init__(self, total, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.total = total
+        self.started = threading.Event()
+        self.thread_ident = None
+
+    def run(self):
+        self.thread_ident = threading.get_ident()
+        self.started.set()
+        for done in range(1, self.total + 1):
+            time.sleep(.001)
+            self.set_progress(done, self.total)
+
+
+class FailingJob(ThreadedJob):
+    def run(self):
+        raise ValueError('oops')
+
+
+def run_job(app, job, timeout=5):
+    results = []
+    progress = []
+    job.finished.connect(results.append)
+    job.progress.connect(progress.append)
+    job.start()
+
+    end = time.monotonic() + timeout
+    while not results and time.monotonic() < end:
+        app.processEvents()
+        time.sleep(.01)
+    return results, progress
+
+
+def test_threaded_job():
+    app = QCoreApplication.instance() or QCoreApplication([])
+
+    job = CountingJob(4)
+    results, progress = run_job(app, job)
+    assert results == [0]
+    assert progress == [25, 50, 75, 100]
+    assert job.thread_ident != threading.get_ident()
+    assert not ThreadedJob.RUNNING
+
+
+def test_threaded_job_cancel():
+    app = QCoreApplication.instance() or QCoreApplication([])
+
+    job = CountingJob(100000)
+    cancelled = []
+    job.finished.connect(cancelled.append)
+    job.start()
+    job.started.wait(5)
+
+    ThreadedJob.cancel_all()
+    assert job._job_thread.isFinished()
+    app.processEvents()
+    assert cancelled == [1]
+    assert not ThreadedJob.RUNNING
+
+    results, _ = run_job(app, FailingJob())
+    assert results == [1]
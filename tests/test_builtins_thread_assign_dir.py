@@ -0,0 +1,104 @@
+# this project is licensed under the WTFPLv2, see COPYING.wtfpl for details
+
+from contextlib import contextmanager
+from pathlib import Path
+
+from lierre.builtins.filters import thread_assign_dir
+from lierre.builtins.filters.thread_assign_dir import build_query, group_by_thread, find_folder, move_in_chunks
+from lierre.utils.maildir_ops import MaildirPP
+
+
+class FakeMessage:
+    def __init__(self, thread_id, *paths):
+        self.thread_id = thread_id
+        self.paths = paths
+
+    def get_thread_id(self):
+        return self.thread_id
+
+    def get_filenames(self):
+        return list(self.paths)
+
+
+def test_build_query():
+    date = 'date:@%d..' % (100000 - 24 * 60 * 60)
+    assert build_query((10, 'uuid'), (15, 'uuid'), 100000) == '(lastmod:11..15 and %s) and folder:"" and not tag:deleted' % date
+
+    # first run, or db was rebuilt
+    expected = '(%s) and folder:"" and not tag:deleted' % date
+    assert build_query(None, (15, 'uuid'), 100000) == expected
+    assert build_query((10, 'old'), (15, 'uuid'), 100000) == expected
+    assert build_query((20, 'uuid'), (15, 'uuid'), 100000) == expected
+
+
+def test_group_by_thread():
+    root = MaildirPP('/m')
+    threads = group_by_thread(root, [
+        FakeMessage('a', '/m/cur/1'),
+        FakeMessage('b', '/m/cur/2', '/m/.Foo/cur/2'),
+        FakeMessage('a', '/m/new/3'),
+    ])
+    assert threads == {
+        'a': [Path('/m/cur/1'), Path('/m/new/3')],
+        'b': [Path('/m/cur/2')],
+    }
+
+
+def test_subfolder_left_alone():
+    root = MaildirPP('/m')
+    top_paths = [Path('/m/.Foo/cur/1:2,')]
+
+    # a reply already filed in another folder would be moved to the thread folder
+    reply = Path('/m/.Sent/cur/2:2,S')
+    assert find_folder(root, reply, top_paths).parts == ('Foo',)
+    # so it is not even considered
+    assert group_by_thread(root, [FakeMessage('a', str(reply))]) == {}
+    assert group_by_thread(root, [FakeMessage('a', str(reply), '/m/new/2')]) == {'a': [Path('/m/new/2')]}
+
+
+def test_find_folder(tmp_path):
+    root = MaildirPP(str(tmp_path))
+    top_paths = [tmp_path.joinpath('.Foo', 'cur', '1:2,')]
+
+    folder = find_folder(root, tmp_path.joinpath('new', '2'), top_paths)
+    assert folder.parts == ('Foo',)
+
+    assert find_folder(root, tmp_path.joinpath('.Foo', 'new', '2'), top_paths) is None
+    assert find_folder(root, tmp_path.joinpath('.Foo', 'cur', '2:2,'), top_paths) is None
+
+
+class RecordingRoot:
+    def __init__(self, events):
+        self.events = events
+
+    def move_messages(self, moves, db, progress):
+        for done, move in enumerate(moves, 1):
+            self.events.append(('move', db, move))
+            progress(done, len(moves))
+
+
+def test_move_in_chunks(monkeypatch):
+    events = []
+
+    @contextmanager
+    def open_db_rw():
+        db = object()
+        events.append(('open', db))
+        yield db
+        events.append(('close', db))
+
+    monkeypatch.setattr(thread_assign_dir, 'open_db_rw', open_db_rw)
+    monkeypatch.setattr(thread_assign_dir, 'MOVE_CHUNK', 2)
+
+    progress = []
+    move_in_chunks(RecordingRoot(events), [1, 2, 3, 4, 5], lambda *args: progress.append(args))
+
+    assert progress == [(1, 5), (2, 5), (3, 5), (4, 5), (5, 5)]
+    # the db is closed, releasing the lock, between chunks
+    assert [(ev[0], ev[2] if ev[0] == 'move' else None) for ev in events] == [
+        ('open', None), ('move', 1), ('move', 2), ('close', None),
+        ('open', None), ('move', 3), ('move', 4), ('close', None),
+        ('open', None), ('move', 5), ('close', None),
+    ]
+    dbs = [ev[1] for ev in events]
+    assert dbs[0] is dbs[3] and dbs[4] is dbs[7] and dbs[0] is not dbs[4]
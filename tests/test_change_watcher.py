@@ -1,6 +1,10 @@
 # this project is licensed under the WTFPLv2, see COPYING.wtfpl for details
 
-from lierre.change_watcher import diff_sorted
+from contextlib import contextmanager
+
+from PyQt5.QtCore import QCoreApplication
+from lierre.change_watcher import diff_sorted, ChangeWatcher
+from lierre.utils import db_ops
 
 
 def test_diff_sorted():
@@ -14,3 +18,96 @@ def test_diff_sorted():
         (None, 'd'),
         ('e', None),
     ]
+
+
+def test_tags_changed_batched():
+    app = QCoreApplication.instance() or QCoreApplication([])
+    watcher = ChangeWatcher()
+    batches = []
+    watcher.tagsChanged.connect(batches.append)
+
+    watcher.tagMailAdded.emit('foo', 'a')
+    watcher.tagMailRemoved.emit('inbox', 'a')
+    watcher.tagMailAdded.emit('inbox', 'a')
+    watcher.tagMailRemoved.emit('inbox', 'b')
+    assert not batches
+
+    app.processEvents()
+    assert batches == [{
+        'a': ({'foo', 'inbox'}, set()),
+        'b': (set(), {'inbox'}),
+    }]
+
+    watcher.tagMailRemoved.emit('foo', 'a')
+    app.processEvents()
+    assert batches[1:] == [{'a': (set(), {'foo'})}]
+
+
+class FakeMessage:
+    def __init__(self, message_id, thread_id, lastmod):
+        self.message_id = message_id
+        self.thread_id = thread_id
+        self.lastmod = lastmod
+
+    def get_message_id(self):
+        return self.message_id
+
+    def get_thread_id(self):
+        return self.thread_id
+
+
+class FakeQuery:
+    def __init__(self, messages):
+        self.messages = messages
+
+    def count_messages(self):
+        return len(self.messages)
+
+    def search_messages(self):
+        return iter(self.messages)
+
+
+class FakeDb:
+    def __init__(self, messages, revision):
+        self.messages = messages
+        self.revision = revision
+
+    def get_revision(self):
+        return self.revision, 'uuid'
+
+    def create_query(self, query_text):
+        if query_text == '*':
+            return FakeQuery(self.messages)
+
+        start, end = map(int, query_text[len('lastmod:'):].split('..'))
+        return FakeQuery([msg for msg in self.messages if start <= msg.lastmod <= end])
+
+
+def test_emit_changes_since(monkeypatch):
+    db = FakeDb([FakeMessage('a', 't1', 1), FakeMessage('b', 't2', 2)], 2)
+
+    @contextmanager
+    def open_db():
+        yield db
+
+    monkeypatch.setattr(db_ops, 'open_db', open_db)
+    watcher = ChangeWatcher()
+    emitted = []
+    watcher.globalRefresh.connect(lambda: emitted.append('global'))
+    watcher.threadsChanged.connect(lambda ids: emitted.append(ids))
+
+    revision = watcher.getRevision()
+    assert revision == (2, 'uuid', 2)
+
+    db.messages.append(FakeMessage('c', 't1', 3))
+    db.revision = 3
+    watcher.emitChangesSince(revision)
+    assert emitted == [['t1']]
+
+    # removed messages can't be queried
+    revision = watcher.getRevision()
+    del db.messages[:2]
+    db.revision = 4
+    emitted.clear()
+    watcher.emitChangesSince(revision)
+    assert emitted == ['global']
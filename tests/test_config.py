@@ -1,6 +1,10 @@
 # this project is licensed under the WTFPLv2, see COPYING.wtfpl for details
 
-from lierre.config import ConfigDict
+import os
+
+from lierre.config import (
+    ConfigDict, get_notmuch_config, get_notmuch_excluded_tags,
+)
 
 
 def test_config():
@@ -16,3 +20,20 @@ def test_config():
 
     d.set('foo', 'bar', 4)
     assert d.get('foo', 'bar') == 4
+
+
+def test_notmuch_config_cache(tmp_path, monkeypatch):
+    path = tmp_path.joinpath('notmuch-config')
+    monkeypatch.setenv('NOTMUCH_CONFIG', str(path))
+
+    assert get_notmuch_excluded_tags() == ()
+
+    path.write_text('[search]\nexclude_tags=deleted;spam;\n')
+    assert get_notmuch_excluded_tags() == ('deleted', 'spam')
+    parser = get_notmuch_config()
+    assert get_notmuch_config() is parser
+
+    path.write_text('[search]\nexclude_tags=spam\n')
+    os.utime(str(path), ns=(0, 0))
+    assert get_notmuch_excluded_tags() == ('spam',)
+    assert get_notmuch_config() is not parser
@@ -0,0 +1,67 @@
+# this project is licensed under the WTFPLv2, see COPYING.wtfpl for details
+
+from email.message import EmailMessage
+import email.policy
+from io import BytesIO
+
+from lierre.mailutils.excerpt import get_excerpt
+
+
+def build_mail(text=None, html=None, attachments=(), cte=None):
+    msg = EmailMessage()
+    msg['Subject'] = 'test'
+    if text is not None:
+        msg.set_content(text, cte=cte)
+    if html is not None:
+        if text is None:
+            msg.set_content(html, subtype='html', cte=cte)
+        else:
+            msg.add_alternative(html, subtype='html', cte=cte)
+    for data in attachments:
+        msg.add_attachment(data, maintype='application', subtype='octet-stream', filename='foo.bin')
+    return msg.as_bytes(policy=email.policy.default)
+
+
+def excerpt_of(data):
+    return get_excerpt(BytesIO(data))
+
+
+def test_plain():
+    assert excerpt_of(build_mail('hello\n\n   world\n')) == 'hello world '
+
+
+def test_quote_skipped():
+    text = '> quoted\n> text\nanswer\n'
+    assert excerpt_of(build_mail(text)) == ' answer '
+
+
+def test_truncated():
+    text = 'foo bar baz\n' * 100
+    assert excerpt_of(build_mail(text)) == ('foo bar baz ' * 10)[:100]
+
+
+def test_encodings():
+    text = 'héllo wörld ' * 20 + '\n'
+    for cte in ('base64', 'quoted-printable', '8bit'):
+        assert excerpt_of(build_mail(text, cte=cte)) == text[:100]
+
+
+def test_attachments():
+    text = 'body text\n'
+    data = build_mail(text, attachments=[b'\0' * 100000, b'--not a boundary\n' * 10])
+    assert excerpt_of(data) == 'body text '
+
+
+def test_alternative():
+    data = build_mail('plain body\n', '<p>html body</p>')
+    assert excerpt_of(data) == 'plain body '
+
+
+def test_html_only():
+    data = build_mail(html='<p>html <b>body</b></p>', attachments=[b'\0' * 1000])
+    assert excerpt_of(data) == 'html **body** '
+
+
+def test_no_body():
+    data = build_mail(attachments=[b'foo'])
+    assert excerpt_of(data) == ''
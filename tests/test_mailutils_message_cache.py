@@ -0,0 +1,51 @@
+# this project is licensed under the WTFPLv2, see COPYING.wtfpl for details
+
+import os
+
+from lierre.mailutils.message_cache import MessageCache
+
+
+def write_message(path, subject, mtime):
+    path.write_bytes(b'Subject: %s\n\nbody\n' % subject.encode())
+    os.utime(path, ns=(mtime, mtime))
+    return str(path)
+
+
+def test_message_cache_mtime(tmp_path):
+    cache = MessageCache()
+    filename = write_message(tmp_path / 'a', 'first', 10**18)
+
+    msg = cache.get_message(filename)
+    assert msg['Subject'] == 'first'
+    assert cache.get_message(filename) is msg
+
+    # same file modified: parsed again
+    write_message(tmp_path / 'a', 'second', 2 * 10**18)
+    assert cache.get_message(filename)['Subject'] == 'second'
+
+    stats = cache.stats()
+    assert stats['hits']['message'] == 1
+    assert stats['misses']['message'] == 2
+
+
+def test_message_cache_bodies(tmp_path):
+    cache = MessageCache(max_size=100)
+    first = write_message(tmp_path / 'a', 'first', 10**18)
+    second = write_message(tmp_path / 'b', 'second', 10**18)
+
+    built = []
+
+    def build(text):
+        built.append(text)
+        return text * 10, False
+
+    assert cache.get_body(first, 'plain', lambda: build('a')) == ('a' * 10, False)
+    assert cache.get_body(first, 'plain', lambda: build('x')) == ('a' * 10, False)
+    assert cache.get_body(first, 'source', lambda: build('b'))[0] == 'b' * 10
+    assert built == ['a', 'b']
+
+    # evicts least recently used entries
+    cache.get_body(second, 'plain', lambda: build('c'))
+    assert cache.stats()['size'] <= 100
+    cache.get_body(first, 'plain', lambda: build('d'))
+    assert built == ['a', 'b', 'c', 'd']
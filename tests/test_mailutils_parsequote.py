@@ -0,0 +1,47 @@
+# this project is licensed under the WTFPLv2, see COPYING.wtfpl for details
+
+from lierre.mailutils.parsequote import (
+    OPEN, CLOSE, LINE, Block, Parser, parse_events, indent_events, to_text,
+)
+
+
+def simplify(events):
+    return [
+        (kind, value.text if kind is LINE else value)
+        for kind, value in events
+    ]
+
+
+def test_events():
+    assert simplify(parse_events('a\n> b\n> > c\n> d\ne')) == [
+        (OPEN, 0), (LINE, 'a'), (CLOSE, 0),
+        (OPEN, 1), (LINE, 'b'),
+        (OPEN, 2), (LINE, 'c'), (CLOSE, 2),
+        (LINE, 'd'), (CLOSE, 1),
+        (OPEN, 0), (LINE, 'e'), (CLOSE, 0),
+    ]
+
+
+def test_events_wrapped():
+    # the block of level 2 is opened before the block of level 3 it contains
+    assert simplify(parse_events('> a\n>>> b\n>> c')) == [
+        (OPEN, 1), (LINE, 'a'),
+        (OPEN, 2), (OPEN, 3), (LINE, 'b'), (CLOSE, 3), (LINE, 'c'), (CLOSE, 2),
+        (CLOSE, 1),
+    ]
+
+    tree = Parser().parse('>>> a\n> b')
+    assert [block.level for block in tree] == [1]
+    assert isinstance(tree[0].content[0], Block)
+    assert tree[0].content[0].level == 3
+
+
+def test_to_text():
+    text = 'a\n> b\n>> c'
+    assert to_text(parse_events(text)) == 'a\n> b\n>> c'
+    assert to_text(indent_events(parse_events(text))) == '> a\n>> b\n>>> c'
+
+
+def test_deep_quoting():
+    text = '\n'.join('>' * level + ' x' for level in range(1, 3000))
+    assert len(Parser().parse(text)) == 1
@@ -0,0 +1,33 @@
+# this project is licensed under the WTFPLv2, see COPYING.wtfpl for details
+
+from lierre.mailutils.plain_html import line_to_html, lines_to_html, plain_to_html
+
+
+LINES = [
+    '',
+    'foo  bar\tbaz',
+    'see http://foo.bar/42.html.',
+    '<http://foo.bar/?a=1&b=2>',
+    'http://foo.bar/a  b and http://foo.bar/',
+    'https://foo.bar/&',
+    'http://x',
+    '"quoted" & <tagged>',
+]
+
+
+def test_lines_to_html():
+    assert lines_to_html(LINES) == [line_to_html(line) for line in LINES]
+    assert lines_to_html([]) == []
+
+
+def test_plain_to_html():
+    assert plain_to_html('foo  bar\n> see http://foo.bar/\nbaz') == (
+        '<p>\n'
+        'foo&nbsp;&nbsp;bar'
+        '<br/></p>\n<blockquote>\n<p>\n'
+        '  see <a href="http://foo.bar/">http://foo.bar/</a>'
+        '<br/></p>\n</blockquote>\n<p>\n'
+        'baz'
+        '<br/></p>\n'
+    )
+    assert plain_to_html('') == '<p>\n</p>\n'
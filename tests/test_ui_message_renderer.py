@@ -0,0 +1,66 @@
+# this project is licensed under the WTFPLv2, see COPYING.wtfpl for details
+
+from email.message import EmailMessage
+import time
+
+from PyQt5.QtCore import QCoreApplication
+from lierre.ui.message_renderer import MessageRenderer, render_message
+
+
+def write_message(path):
+    msg = EmailMessage()
+    msg['Subject'] = 'test'
+    msg.set_content('hello http://example.com/\n> quoted\n')
+    msg.add_attachment(b'data', maintype='application', subtype='octet-stream', filename='foo.bin')
+    path.write_bytes(bytes(msg))
+    return str(path)
+
+
+def wait_for(app, results, timeout=5):
+    end = time.monotonic() + timeout
+    while not results and time.monotonic() < end:
+        app.processEvents()
+        time.sleep(.01)
+
+
+def test_render_message(tmp_path):
+    filename = write_message(tmp_path / 'msg')
+
+    ret = render_message(filename, 'plain')
+    assert ret.is_html
+    assert '<a href="http://example.com/">http://example.com/</a>' in ret.body
+    assert '<blockquote>' in ret.body
+    assert ret.attachments == ['foo.bin']
+
+    # the parsed message is reused for another format
+    source = render_message(filename, 'source')
+    assert source.pymessage is ret.pymessage
+    assert not source.is_html
+    assert 'Subject: test' in source.body
+    assert render_message(filename, 'html').body is None
+
+
+def test_renderer_cancel(tmp_path):
+    app = QCoreApplication.instance() or QCoreApplication([])
+    filename = write_message(tmp_path / 'msg')
+    renderer = MessageRenderer()
+
+    results = []
+    cancelled = renderer.render(filename, 'plain', results.append)
+    cancelled.cancel()
+    renderer.render(filename, 'plain', results.append)
+
+    wait_for(app, results)
+    # let the cancelled job be delivered if it were to be
+    time.sleep(.1)
+    app.processEvents()
+
+    assert len(results) == 1
+    assert results[0].attachments == ['foo.bin']
+
+    results.clear()
+    renderer.render(str(tmp_path / 'missing'), 'plain', results.append)
+    wait_for(app, results)
+    assert results == [None]
+
+    renderer.shutdown()
@@ -1,6 +1,6 @@
 # this project is licensed under the WTFPLv2, see COPYING.wtfpl for details
 
-from lierre.ui.messagesview import LINK_RE
+from lierre.mailutils.plain_html import LINK_RE
 
 
 def test_link_parse():
@@ -0,0 +1,246 @@
+# this project is licensed under the WTFPLv2, see COPYING.wtfpl for details
+
+from contextlib import contextmanager
+
+from notmuch import NotmuchError
+from PyQt5.QtCore import QModelIndex
+from lierre.change_watcher import ChangeWatcher
+from lierre.config import CONFIG
+from lierre.ui import models
+from lierre.ui.models import BasicListModel, BasicTreeModel, ThreadListModel, ThreadRow, tag_to_colors
+
+
+class NamesModel(BasicListModel):
+    columns = (('Name', 'name'),)
+
+    def _sort_key(self, d):
+        return d['name']
+
+
+class NamesTreeModel(BasicTreeModel):
+    columns = (('Name', 'key'),)
+
+
+class InvalidatedThreadsModel(ThreadListModel):
+    def __init__(self, rows):
+        super().__init__()
+        self.rows = rows
+        self.skips = []
+        self.invalidate_after = None
+
+    def _iter_objs(self, skip=0):
+        self.skips.append(skip)
+        for n, row in enumerate(self.rows[skip:]):
+            if n == self.invalidate_after:
+                self.invalidate_after = None
+                raise NotmuchError()
+            yield row
+
+
+class FakeThread:
+    def __init__(self, id, last_update, tags=()):
+        self.id = id
+        self.last_update = last_update
+        self.tags = list(tags)
+
+    def get_thread_id(self):
+        return self.id
+
+    def get_authors(self):
+        return 'author'
+
+    def get_subject(self):
+        return 'subject'
+
+    def get_total_messages(self):
+        return 1
+
+    def get_newest_date(self):
+        return self.last_update
+
+    def get_tags(self):
+        return self.tags
+
+
+class FakeDbThreadsModel(ThreadListModel):
+    def __init__(self, threads):
+        super().__init__()
+        self.threads = {thread.id: thread for thread in threads}
+
+    def _query_threads(self, db, thread_ids):
+        return [self.threads[tid] for tid in thread_ids if tid in self.threads]
+
+    def _iter_objs(self, skip=0):
+        # snapshot of the db when the query starts
+        rows = sorted(map(ThreadRow.from_thread, self.threads.values()), key=self._sort_key)
+        yield from rows[skip:]
+
+    def find_message(self, message_id):
+        # the fake db: each thread has a message of the same id
+        return FakeThread(message_id, 0)
+
+
+def setup_fake_db(monkeypatch, threads):
+    monkeypatch.setattr(models, 'WATCHER', ChangeWatcher())
+    model = FakeDbThreadsModel(threads)
+
+    @contextmanager
+    def open_db():
+        yield model
+
+    monkeypatch.setattr(models, 'open_db', open_db)
+    monkeypatch.setattr(models, 'get_thread_by_id', lambda db, tid: model.threads.get(tid))
+    model.query_text = '*'
+    return model
+
+
+def test_tree_parent_rows():
+    model = NamesTreeModel()
+    tree = {
+        None: ['a', 'b'],
+        'b': ['c', 'd', 'e'],
+        'e': ['f'],
+    }
+    model._setTree(tree, {key: {'key': key} for key in 'abcdef'})
+
+    for parent, children in tree.items():
+        for row, key in enumerate(children):
+            qidx = model._keyToIndex(key)
+            assert qidx.row() == row
+            assert qidx.internalPointer()['key'] == key
+
+            parent_qidx = model.parent(qidx)
+            if parent is None:
+                assert not parent_qidx.isValid()
+            else:
+                assert parent_qidx.internalPointer()['key'] == parent
+                assert parent_qidx == model._keyToIndex(parent)
+                assert model.index(row, 0, parent_qidx) == qidx
+
+
+def test_tag_to_colors_config_change(monkeypatch):
+    monkeypatch.setitem(CONFIG, 'ui', {'tag_colors': {'foo': '#ffff00'}})
+
+    fg, bg = tag_to_colors('foo/bar')
+    assert bg.color().name() == '#ffff00'
+    assert fg.color().name() == '#000000'
+    assert tag_to_colors('foo/bar') is tag_to_colors('foo/bar')
+
+    CONFIG.set('ui', 'tag_colors', 'foo', '#000080')
+    fg, bg = tag_to_colors('foo/bar')
+    assert bg.color().name() == '#000080'
+    assert fg.color().name() == '#ffffff'
+
+    CONFIG['ui']['tag_colors'].pop('foo')
+    assert tag_to_colors('foo/bar')[1].color().name() != '#000080'
+
+
+def test_update_objs_ranges():
+    model = NamesModel()
+    model._setObjs([{'name': name} for name in 'bcdfgh'])
+    kept = model.objs[3]
+
+    ops = []
+    model.rowsInserted.connect(lambda _, first, last: ops.append(('insert', first, last)))
+    model.rowsRemoved.connect(lambda _, first, last: ops.append(('remove', first, last)))
+    model.dataChanged.connect(lambda qidx1, qidx2: ops.append(('change', qidx1.row(), qidx2.row())))
+
+    model._updateObjs([{'name': name, 'new': True} for name in 'abfhijk'])
+
+    assert [obj['name'] for obj in model.objs] == list('abfhijk')
+    assert all(obj['new'] for obj in model.objs)
+    assert model.objs[2] is kept
+    assert ops == [
+        ('insert', 0, 0),
+        ('change', 1, 1),
+        ('remove', 2, 3),
+        ('change', 2, 2),
+        ('remove', 3, 3),
+        ('change', 3, 3),
+        ('insert', 4, 6),
+    ]
+
+
+def test_threads_query_invalidated(monkeypatch):
+    monkeypatch.setattr(models, 'WATCHER', ChangeWatcher())
+    rows = [ThreadRow(str(n), 'author', 'subject', 1, 100 - n, []) for n in range(8)]
+    model = InvalidatedThreadsModel(rows)
+    model.query_text = '*'
+    model._setObjs(rows[:5])
+
+    # restarted after the threads yielded by the new query, not the loaded ones
+    model.invalidate_after = 2
+    model.refresh()
+    assert model.skips == [0, 2]
+    assert [obj.id for obj in model.objs] == [row.id for row in rows]
+
+
+def test_refresh_threads(monkeypatch):
+    @contextmanager
+    def open_db():
+        yield None
+
+    monkeypatch.setattr(models, 'WATCHER', ChangeWatcher())
+    monkeypatch.setattr(models, 'open_db', open_db)
+
+    threads = [FakeThread(str(n), 100 - n) for n in range(8)]
+    model = FakeDbThreadsModel(threads)
+    model.query_text = '*'
+    model._setObjs([ThreadRow.from_thread(thread) for thread in threads])
+    model.indexes = {obj.id: n for n, obj in enumerate(model.objs)}
+
+    ops = []
+    model.rowsInserted.connect(lambda _, first, last: ops.append(('insert', first, last)))
+    model.rowsRemoved.connect(lambda _, first, last: ops.append(('remove', first, last)))
+
+    # 1 is changed in place, 3 moves to the top, 5 and 6 were removed, x is new
+    model.threads['1'].tags = ['foo']
+    model.threads['3'].last_update = 200
+    del model.threads['5']
+    del model.threads['6']
+    model.threads['x'] = FakeThread('x', 93.5)
+    model.refreshThreads(['1', '3', '5', '6', 'x'])
+
+    assert [obj.id for obj in model.objs] == ['3', '0', '1', '2', '4', 'x', '7']
+    assert model.objs[2].tags == ('foo',)
+    assert model.indexes == {obj.id: n for n, obj in enumerate(model.objs)}
+    assert ops == [
+        ('insert', 0, 0),
+        ('remove', 4, 4),
+        ('remove', 5, 6),
+        ('insert', 5, 5),
+    ]
+
+
+def test_refresh_threads_pending(monkeypatch):
+    model = setup_fake_db(monkeypatch, [FakeThread(str(n), 100 - n) for n in range(8)])
+    model.PAGE_SIZE = 4
+    model.setQuery('*')
+    assert [obj.id for obj in model.objs] == ['0', '1', '2', '3']
+
+    # last loaded row now sorts after threads not loaded yet
+    model.threads['3'].last_update = 50
+    model.refreshThreads(['3'])
+    assert [obj.id for obj in model.objs] == ['0', '1', '2']
+
+    while model.canFetchMore(QModelIndex()):
+        model.fetchMore(QModelIndex())
+    assert [obj.id for obj in model.objs] == ['0', '1', '2', '4', '5', '6', '7', '3']
+
+
+def test_refresh_removed_threads(monkeypatch):
+    model = setup_fake_db(monkeypatch, [FakeThread(str(n), 100 - n) for n in range(8)])
+    model.PAGE_SIZE = 4
+    model.setQuery('*')
+
+    # tags of 6 changed, then it was removed before pending query yields it
+    model.refreshMails({'6': None})
+    assert model.outdated == {'6'}
+    del model.threads['6']
+    model.fetchMore(QModelIndex())
+    assert [obj.id for obj in model.objs] == ['0', '1', '2', '3', '4', '5', '7']
+
+    # tags of 1 changed, but it was removed before the change is handled
+    del model.threads['1']
+    model.refreshMails({'1': None})
+    assert [obj.id for obj in model.objs] == ['0', '2', '3', '4', '5', '7']
@@ -0,0 +1,183 @@
+# this project is licensed under the WTFPLv2, see COPYING.wtfpl for details
+
+from contextlib import contextmanager
+
+import pytest
+from notmuch import NotmuchError, XapianError
+from PyQt5.QtCore import QCoreApplication
+from lierre.change_watcher import ChangeWatcher
+from lierre.utils import db_ops
+from lierre.utils.db_ops import ExcerptBuilder
+
+
+class FakeMessage:
+    def __init__(self, message_id, excerpt):
+        self.message_id = message_id
+        self.excerpt = excerpt
+
+    def get_message_id(self):
+        return self.message_id
+
+    def get_property(self, name):
+        return self.excerpt
+
+    def get_filename(self):
+        return '/nonexistent/%s' % self.message_id
+
+
+class FakeDb:
+    def __init__(self, messages):
+        self.messages = {msg.get_message_id(): msg for msg in messages}
+
+    def find_message(self, message_id):
+        return self.messages.get(message_id)
+
+    def create_query(self, query_text):
+        return FakeQuery(list(self.messages.values()))
+
+
+class FakeQuery:
+    def __init__(self, messages):
+        self.messages = messages
+
+    def search_messages(self):
+        return iter(self.messages)
+
+
+class FakeThread:
+    def __init__(self, messages):
+        self.messages = messages
+
+    def get_toplevel_messages(self):
+        return self.messages[:1]
+
+
+class RecordingPool:
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, func, *args):
+        self.submitted.append(args)
+
+    def shutdown(self, wait):
+        pass
+
+
+def test_get_or_build_many_removed(monkeypatch):
+    monkeypatch.setattr(db_ops, 'WATCHER', ChangeWatcher())
+    db = FakeDb([FakeMessage('a', 'excerpt of a')])
+
+    @contextmanager
+    def open_db():
+        yield db
+
+    monkeypatch.setattr(db_ops, 'open_db', open_db)
+    builder = ExcerptBuilder()
+
+    # "b" was removed from the db before its id was handled
+    assert builder.getOrBuildMany(['a', 'b']) == {'a': 'excerpt of a'}
+    builder.shutdown()
+
+
+class FakeTimerEvent:
+    def __init__(self, timer_id):
+        self.timer_id = timer_id
+
+    def timerId(self):
+        return self.timer_id
+
+
+def test_store_excerpts_locked(monkeypatch):
+    app = QCoreApplication.instance() or QCoreApplication([])
+    monkeypatch.setattr(db_ops, 'WATCHER', ChangeWatcher())
+
+    @contextmanager
+    def open_db_rw():
+        raise NotmuchError('Unable to get write lock')
+        yield
+
+    monkeypatch.setattr(db_ops, 'open_db_rw', open_db_rw)
+    builder = ExcerptBuilder()
+    stored = []
+    builder.builtExcerpt.connect(lambda *args: stored.append(args))
+
+    builder._storeLater('a', 'excerpt of a')
+    builder.timerEvent(FakeTimerEvent(builder.timer.timerId()))
+
+    # kept for a later try
+    assert builder.built == {'a': 'excerpt of a'}
+    assert builder.timer.isActive()
+    assert not stored
+    builder.timer.stop()
+    builder.shutdown()
+    app.processEvents()
+
+
+def test_prefetch(monkeypatch):
+    monkeypatch.setattr(db_ops, 'WATCHER', ChangeWatcher())
+    messages = [FakeMessage(message_id, None) for message_id in 'abcde']
+    messages[0].get_replies = lambda: messages[1:2]
+    messages[1].get_replies = lambda: []
+    db = FakeDb(messages)
+
+    @contextmanager
+    def open_db():
+        yield db
+
+    monkeypatch.setattr(db_ops, 'open_db', open_db)
+    monkeypatch.setattr(db_ops, 'get_thread_by_id', lambda db, tid: FakeThread(messages) if tid == 't' else None)
+    builder = ExcerptBuilder()
+    builder.pool = RecordingPool()
+    builder.PREFETCH_LIMIT = 2
+
+    # built but not stored yet, it is not queued again
+    builder.built['a'] = 'excerpt of a'
+    assert builder.getOrBuildThread('t') == {'a': 'excerpt of a', 'b': None}
+    assert builder.getOrBuildThread('removed') == {}
+    assert builder.building == {'b'}
+
+    # prefetching stops at PREFETCH_LIMIT mails being built
+    assert builder.prefetchQuery('*') == 1
+    assert builder.building == {'b', 'c'}
+    builder._prefetchMessages(['d', 'e'])
+    assert builder.building == {'b', 'c'}
+
+    # in flight mails are not queued twice
+    builder.getOrBuildMany(['b', 'c'])
+    assert [message_id for message_id, _ in builder.pool.submitted] == ['b', 'c']
+    builder.shutdown()
+
+
+class LockedDatabase:
+    failures = 0
+
+    def __init__(self, mode):
+        if LockedDatabase.failures:
+            LockedDatabase.failures -= 1
+            raise XapianError()
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.closed = True
+
+
+def test_open_db_rw_locked(monkeypatch):
+    monkeypatch.setattr(db_ops, 'Database', LockedDatabase)
+    monkeypatch.setattr(db_ops, 'LOCK_INTERVAL', 0)
+
+    # lock released by a job after a while
+    LockedDatabase.failures = 3
+    with db_ops.open_db_rw() as db:
+        assert not db.closed
+    assert db.closed
+    assert LockedDatabase.failures == 0
+
+    # lock never released
+    monkeypatch.setattr(db_ops, 'LOCK_TIMEOUT', 0)
+    LockedDatabase.failures = 1
+    with pytest.raises(XapianError):
+        with db_ops.open_db_rw():
+            pass
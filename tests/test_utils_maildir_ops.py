@@ -1,8 +1,189 @@
 # this project is licensed under the WTFPLv2, see COPYING.wtfpl for details
 
-from lierre.utils.maildir_ops import encode_maildir_name, decode_maildir_name
+import errno
+from pathlib import Path
+
+from lierre.utils import maildir_ops
+from lierre.utils.maildir_ops import encode_maildir_name, decode_maildir_name, MaildirPP, change_flags_many
 
 
 def test_maildir_encodings():
     assert encode_maildir_name('Rés.umé') == 'R&AOk-s&AC4-um&AOk-'
     assert 'Rés.umé' == decode_maildir_name('R&AOk-s&AC4-um&AOk-')
+
+
+def make_maildir(tmp_path):
+    box = MaildirPP(tmp_path)
+    box.create_folder(box.get_root())
+    folder = box.try_get_folder(['Trash'])
+    box.create_folder(folder)
+
+    msg_path = tmp_path.joinpath('cur', '1.M1P1.host:2,S')
+    msg_path.write_bytes(b'Subject: foo\n\nbar\n')
+    return box, folder, msg_path
+
+
+def test_move_message(tmp_path):
+    box, folder, msg_path = make_maildir(tmp_path)
+    inode = msg_path.stat().st_ino
+
+    dest_path = box.move_message(msg_path, folder)
+    assert dest_path.parent == folder.path.joinpath('cur')
+    assert dest_path.name.endswith(':2,S')
+    assert dest_path.read_bytes() == b'Subject: foo\n\nbar\n'
+    # renamed, not copied
+    assert dest_path.stat().st_ino == inode
+    assert not msg_path.exists()
+    assert not list(folder.path.joinpath('tmp').iterdir())
+
+
+def test_move_message_cross_device(tmp_path, monkeypatch):
+    box, folder, msg_path = make_maildir(tmp_path)
+
+    orig_rename = Path.rename
+
+    def rename(self, target):
+        if self == msg_path:
+            raise OSError(errno.EXDEV, 'Invalid cross-device link')
+        return orig_rename(self, target)
+
+    monkeypatch.setattr(Path, 'rename', rename)
+
+    dest_path = box.move_message(msg_path, folder)
+    assert dest_path.read_bytes() == b'Subject: foo\n\nbar\n'
+    assert dest_path.name.endswith(':2,S')
+    assert not msg_path.exists()
+    assert not list(folder.path.joinpath('tmp').iterdir())
+
+
+class RecordingDb:
+    def __init__(self, messages=None):
+        self.calls = []
+        self.messages = messages or {}
+
+    def find_message_by_filename(self, path):
+        return self.messages.get(path)
+
+    def begin_atomic(self):
+        self.calls.append(('begin_atomic',))
+
+    def end_atomic(self):
+        self.calls.append(('end_atomic',))
+
+    def add_message(self, path):
+        self.calls.append(('add_message', path))
+
+    def remove_message(self, path):
+        self.calls.append(('remove_message', path))
+
+
+def test_move_messages(tmp_path):
+    box, folder, msg_path = make_maildir(tmp_path)
+    missing_path = tmp_path.joinpath('cur', '2.M2P2.host:2,')
+
+    db = RecordingDb()
+    progress = []
+    result = box.move_messages(
+        [(msg_path, folder), (missing_path, folder)], db,
+        lambda done, total: progress.append((done, total)),
+    )
+
+    assert len(result.moved) == 1
+    old_path, new_path = result.moved[0]
+    assert old_path == msg_path and new_path.exists()
+    assert [path for path, _ in result.failed] == [missing_path]
+    assert progress == [(1, 2), (2, 2)]
+
+    # all index updates in one atomic block
+    assert db.calls == [
+        ('begin_atomic',),
+        ('add_message', str(new_path)),
+        ('remove_message', str(msg_path)),
+        ('end_atomic',),
+    ]
+
+
+class FakeMessage:
+    def __init__(self, path, tags):
+        self.path = path
+        self.tags = set(tags)
+        self.synced = False
+
+    def get_message_id(self):
+        return 'id@example.com'
+
+    def get_tags(self):
+        return list(self.tags)
+
+    def add_tag(self, tag):
+        self.tags.add(tag)
+
+    def remove_tag(self, tag):
+        self.tags.discard(tag)
+
+    def freeze(self):
+        pass
+
+    def thaw(self):
+        pass
+
+    def tags_to_maildir_flags(self):
+        self.synced = True
+
+    def get_filenames(self):
+        return [self.path]
+
+
+class RecordingSignal:
+    def __init__(self):
+        self.emitted = []
+
+    def emit(self, *args):
+        self.emitted.append(args)
+
+
+class RecordingWatcher:
+    def __init__(self):
+        self.tagMailAdded = RecordingSignal()
+        self.tagMailRemoved = RecordingSignal()
+
+
+def test_change_flags_many(tmp_path, monkeypatch):
+    watcher = RecordingWatcher()
+    monkeypatch.setattr(maildir_ops, 'WATCHER', watcher)
+
+    cur = tmp_path.joinpath('cur')
+    cur.mkdir()
+    renamed_path = cur.joinpath('1.M1P1.host:2,S')
+    renamed_path.touch()
+    tagged_path = cur.joinpath('2.M2P2.host:2,')
+    tagged_path.touch()
+    bad_path = cur.joinpath('3.M3P3.host')
+    bad_path.touch()
+
+    msg = FakeMessage(str(tagged_path), ['unread', 'inbox'])
+    db = RecordingDb({str(tagged_path): msg})
+    result = change_flags_many([
+        (renamed_path, 'TF', 'S'),
+        (tagged_path, 'SF', ''),
+        (bad_path, 'S', ''),
+    ], db)
+
+    new_path = cur.joinpath('1.M1P1.host:2,FT')
+    assert result.renamed == [(renamed_path, new_path), (tagged_path, tagged_path)]
+    assert new_path.exists() and not renamed_path.exists()
+    assert [path for path, _ in result.failed] == [bad_path]
+    assert result.rate > 0
+
+    # synced flags are changed through tags, and notmuch renames the file
+    assert msg.tags == {'inbox', 'flagged'}
+    assert msg.synced
+    assert watcher.tagMailAdded.emitted == [('flagged', 'id@example.com')]
+    assert watcher.tagMailRemoved.emitted == [('unread', 'id@example.com')]
+
+    assert db.calls == [
+        ('begin_atomic',),
+        ('add_message', str(new_path)),
+        ('remove_message', str(renamed_path)),
+        ('end_atomic',),
+    ]
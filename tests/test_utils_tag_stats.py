@@ -0,0 +1,90 @@
+# this project is licensed under the WTFPLv2, see COPYING.wtfpl for details
+
+from collections import Counter
+from contextlib import contextmanager
+import time
+
+from PyQt5.QtCore import QCoreApplication
+from lierre.change_watcher import ChangeWatcher
+from lierre.utils import tag_stats
+from lierre.utils.tag_stats import TagStats, count_message_tags
+
+
+def test_count_message_tags():
+    unread = Counter()
+    total = Counter()
+    excluded = {'deleted', 'spam'}
+
+    count_message_tags({'inbox', 'unread'}, excluded, unread, total)
+    count_message_tags({'inbox'}, excluded, unread, total)
+    count_message_tags({'inbox', 'unread', 'deleted'}, excluded, unread, total)
+    count_message_tags({'inbox', 'deleted', 'spam'}, excluded, unread, total)
+
+    assert total == {'inbox': 2, 'unread': 1, 'deleted': 1}
+    assert unread == {'inbox': 1, 'unread': 1, 'deleted': 1}
+
+
+class FakeMessage:
+    def __init__(self, tags):
+        self.tags = tags
+
+    def get_tags(self):
+        return list(self.tags)
+
+
+class FakeQuery:
+    def __init__(self, messages):
+        self.messages = messages
+
+    def search_messages(self):
+        return iter(self.messages)
+
+
+class FakeDb:
+    def __init__(self, messages):
+        self.messages = messages
+
+    def get_all_tags(self):
+        return sorted({tag for msg in self.messages for tag in msg.tags})
+
+    def create_query(self, query_text):
+        assert query_text == '*'
+        return FakeQuery(self.messages)
+
+
+def test_build_in_thread(monkeypatch):
+    app = QCoreApplication.instance() or QCoreApplication([])
+    monkeypatch.setattr(tag_stats, 'WATCHER', ChangeWatcher())
+    monkeypatch.setattr(tag_stats, 'get_notmuch_excluded_tags', lambda: ['deleted'])
+
+    db = FakeDb([
+        FakeMessage({'inbox', 'unread'}),
+        FakeMessage({'inbox'}),
+        FakeMessage({'inbox', 'deleted'}),
+    ])
+
+    @contextmanager
+    def open_private_db():
+        yield db
+
+    monkeypatch.setattr(tag_stats, 'open_private_db', open_private_db)
+    stats = TagStats()
+    changed = []
+    stats.changed.connect(lambda: changed.append(True))
+
+    # tags are known at once, counts later
+    stats.ensureBuilt(db)
+    assert stats.counts == {'deleted': None, 'inbox': None, 'unread': None}
+
+    end = time.monotonic() + 5
+    while not changed and time.monotonic() < end:
+        app.processEvents()
+        time.sleep(.01)
+    assert stats.counts == {'deleted': (0, 1), 'inbox': (1, 2), 'unread': (1, 1)}
+
+    # only tags of changed messages are recounted, not all tags
+    stats._messagesChanged(['a'])
+    assert not stats.dirty_tags
+    assert stats.dirty_msgs == {'a'}
+    stats.timer.stop()
+    stats.shutdown()